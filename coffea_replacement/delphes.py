@@ -9,10 +9,16 @@ class DelphesSchema(BaseSchema):
     the naming pattern of the branches. The following additional arrays are constructed:
 
     - Any branches named ``{name}_size`` are assumed to be counts branches and converted to offsets ``o{name}``
+
+    If ``collections`` is set (see ``with_collections``), forms are only built for
+    the listed collections and all other branches are ignored.
     """
 
     warn_missing_crossrefs = True
 
+    # Allow-list of collections to build; None means all collections in the file
+    collections = None
+
     mixins = {
         "CaloJet02": "Jet",
         "CaloJet04": "Jet",
@@ -213,6 +219,15 @@ class DelphesSchema(BaseSchema):
         """
         return cls(base_form, version="1")
 
+    @classmethod
+    def with_collections(cls, collections):
+        """Schema restricted to a list of collections
+
+        For example, ``NanoEventsFactory.from_root("file.root",
+        schemaclass=DelphesSchema.with_collections(["Event", "MuonMedium"]))``
+        """
+        return type(cls.__name__, (cls,), {"collections": list(collections)})
+
     def _build_collections(self, branch_forms):
         def _tlorentz_vectorize(objname, form):
             # first handle RecordArray
@@ -235,6 +250,15 @@ class DelphesSchema(BaseSchema):
             form["content"] = _tlorentz_vectorize(objname, form["content"])
             return form
 
+        # drop branches of collections that are not requested
+        if self.collections is not None:
+            keep = set(self.collections)
+            branch_forms = {
+                k: v
+                for k, v in branch_forms.items()
+                if k.split("/")[0].replace("_size", "") in keep
+            }
+
         # preprocess lorentz vectors properly (and recursively)
         for objname, form in branch_forms.items():
             branch_forms[objname] = _tlorentz_vectorize(objname, form)
@@ -12,3 +12,12 @@ parameters = {
     "jet_eta_cut": 5.0,
     "min_dr_mu_jet": 0.4,
 }
+
+# Collections read from Delphes files
+parameters["collections"] = [
+    "Event",
+    "GenJet",
+    parameters["muon_branch"],
+    parameters["electron_branch"],
+    parameters["jet_branch"],
+]
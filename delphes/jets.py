@@ -1,9 +1,48 @@
 import numpy as np
+import numba
 from python.math_tools import p4_sum, delta_r, rapidity
 import awkward as ak
 import pandas as pd
 
 
+def jet_muon_cleaning(jets, muons, min_dr):
+    # Mask of jets with dR > min_dr from all muons, without jet-muon pairs
+    jet_counts = ak.to_numpy(ak.num(jets.Eta, axis=1))
+    mu_counts = ak.to_numpy(ak.num(muons.Eta, axis=1))
+    jet_offsets = np.concatenate([[0], np.cumsum(jet_counts)])
+    mu_offsets = np.concatenate([[0], np.cumsum(mu_counts)])
+
+    mask = np.empty(jet_offsets[-1], dtype=np.bool_)
+    _jet_muon_cleaning_kernel(
+        jet_offsets,
+        ak.to_numpy(ak.flatten(jets.Eta)).astype(np.float64),
+        ak.to_numpy(ak.flatten(jets.Phi)).astype(np.float64),
+        mu_offsets,
+        ak.to_numpy(ak.flatten(muons.Eta)).astype(np.float64),
+        ak.to_numpy(ak.flatten(muons.Phi)).astype(np.float64),
+        min_dr * min_dr,
+        mask,
+    )
+    return ak.unflatten(mask, jet_counts)
+
+
+@numba.njit
+def _jet_muon_cleaning_kernel(
+    jet_offsets, jet_eta, jet_phi, mu_offsets, mu_eta, mu_phi, min_dr2, mask
+):
+    # jets in events without muons pass the cleaning
+    for iev in range(len(jet_offsets) - 1):
+        for ijet in range(jet_offsets[iev], jet_offsets[iev + 1]):
+            dr2_min = np.inf
+            for imu in range(mu_offsets[iev], mu_offsets[iev + 1]):
+                deta = jet_eta[ijet] - mu_eta[imu]
+                dphi = (jet_phi[ijet] - mu_phi[imu] + np.pi) % (2 * np.pi) - np.pi
+                dr2 = deta * deta + dphi * dphi
+                if dr2 < dr2_min:
+                    dr2_min = dr2
+            mask[ijet] = dr2_min > min_dr2
+
+
 def fill_jets(output, jet1, jet2):
     variable_names = [
         "jet1_pt",
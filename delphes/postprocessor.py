@@ -1,51 +1,52 @@
 import os
 
+import numpy as np
 import dask.dataframe as dd
 import pandas as pd
-from python.io import load_pandas_from_parquet
 
-# from python.categorizer import split_into_channels
+# from python.categorizer import categorize_partition
 
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 pd.options.mode.chained_assignment = None
 
 
 def load_dataframe(client, parameters, inputs=[], timer=None):
-
+    """
+    Returns a lazy Dask DataFrame with a global row index. Only the
+    columns used downstream are read from the stage1 outputs;
+    the caller decides when to compute the result.
+    """
     if isinstance(inputs, list):
-        # Load dataframes
-        df_future = client.map(load_pandas_from_parquet, inputs)
-        df_future = client.gather(df_future)
-
-        # Merge dataframes
-        try:
-            df = dd.concat([d for d in df_future if len(d.columns) > 0])
-        except Exception:
+        dfs = []
+        for path in inputs:
+            if len(path) == 0:
+                continue
+            try:
+                # only the Parquet metadata is read here
+                columns = select_columns(dd.read_parquet(path).columns, parameters)
+                dfs.append(dd.read_parquet(path, columns=columns))
+            except Exception as e:
+                print(f"Skipping {path}: {e}")
+                continue
+        if len(dfs) == 0:
             return
-
-        npart = df.npartitions
-        df = df.compute()
-        df.reset_index(inplace=True, drop=True)
-        df = dd.from_pandas(df, npartitions=npart)
-        if df.npartitions > 2 * parameters["ncpus"]:
-            df = df.repartition(npartitions=parameters["ncpus"])
+        df = dd.concat(dfs)
 
     elif isinstance(inputs, pd.DataFrame):
-        df = dd.from_pandas(inputs, npartitions=parameters["ncpus"])
+        columns = select_columns(inputs.columns, parameters)
+        df = dd.from_pandas(inputs[columns], npartitions=parameters["ncpus"])
 
     elif isinstance(inputs, dd.DataFrame):
-        df = inputs
-        npart = df.npartitions
-        df = df.compute()
-        df.reset_index(inplace=True, drop=True)
-        df = dd.from_pandas(df, npartitions=npart)
-        if df.npartitions > 2 * parameters["ncpus"]:
-            df = df.repartition(npartitions=parameters["ncpus"])
+        df = inputs[select_columns(inputs.columns, parameters)]
 
     else:
         print("Wrong input type:", type(inputs))
         return None
 
+    if df.npartitions > 2 * parameters["ncpus"]:
+        df = df.repartition(npartitions=parameters["ncpus"])
+    df = add_global_index(df)
+
     # temporary
     df["channel"] = "vbf"
     if ("dataset" not in df.columns) and ("s" in df.columns):
@@ -55,6 +56,11 @@ def load_dataframe(client, parameters, inputs=[], timer=None):
     if ("channel" not in df.columns) and ("c" in df.columns):
         df["channel"] = df["c"]
 
+    keep_columns = select_columns(df.columns, parameters)
+    return df[[c for c in keep_columns if c not in ["s", "r", "c"]]]
+
+
+def select_columns(columns, parameters):
     keep_columns = [
         "dataset",
         "year",
@@ -66,16 +72,20 @@ def load_dataframe(client, parameters, inputs=[], timer=None):
         "jet1_pt",
         "njets",
     ]
-    keep_columns += [c for c in df.columns if "wgt" in c]
     keep_columns += parameters["hist_vars"]
-    keep_columns = list(set(keep_columns))
+    # sources of dataset, region and channel in older outputs
+    keep_columns += ["s", "r", "c"]
+    return [c for c in columns if (c in keep_columns) or ("wgt" in c)]
 
-    df = df[[c for c in keep_columns if c in df.columns]]
-    df = df.compute()
 
-    # split_into_channels(df)
+def add_global_index(df):
+    # Row numbers across partitions, from cumulative partition lengths
+    lengths = df[df.columns[0]].map_partitions(len).compute()
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(int)
+    return df.map_partitions(set_index_offset, offsets, meta=df._meta)
 
-    df.dropna(axis=1, inplace=True)
-    df.reset_index(inplace=True)
 
+def set_index_offset(df, offsets, partition_info=None):
+    start = offsets[partition_info["number"]] if partition_info else 0
+    df.index = pd.RangeIndex(start, start + len(df))
     return df
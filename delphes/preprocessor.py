@@ -1,25 +1,67 @@
+import os
 import glob
 import tqdm
 import json
-import awkward as ak
-from coffea.nanoevents import DelphesSchema, NanoEventsFactory
+import uproot
 
 from delphes.config.cross_sections import cross_sections
 
 
-def get_sum_wgts(file):
+def get_num_entries(file, treename="Delphes"):
+    # Only the tree metadata is read
     try:
-        events = NanoEventsFactory.from_root(
-            file, "Delphes", schemaclass=DelphesSchema
-        ).events()
-        # result = (file, ak.sum(events.Event.Weight))
-        result = (file, ak.count(events.Event.Number))
+        with uproot.open(file) as f:
+            result = (file, f[treename].num_entries)
     except Exception:
         result = (file, 0)
     return result
 
 
-def get_fileset(client, datasets, parameters, save_to=None, load_from=None):
+def update_file_catalog(client, filelist, catalog_path=None):
+    """
+    Number of events in each file. Counts are cached in a JSON catalog
+    together with the file size and modification time, and only new or
+    modified files are read again.
+    """
+    catalog = {}
+    if catalog_path and os.path.exists(catalog_path):
+        with open(catalog_path, "r") as fp:
+            catalog = json.load(fp)
+
+    stats = {}
+    for file in filelist:
+        try:
+            st = os.stat(file)
+            stats[file] = [st.st_size, st.st_mtime]
+        except OSError:
+            stats[file] = None
+    to_read = [
+        file
+        for file in filelist
+        if (file not in catalog)
+        or ([catalog[file]["size"], catalog[file]["mtime"]] != stats[file])
+    ]
+
+    if len(to_read) > 0:
+        futures = client.map(get_num_entries, to_read)
+        for file, nevents in client.gather(futures):
+            catalog.pop(file, None)
+            # unreadable files are not cached, so that they are retried
+            if (nevents > 0) and (stats[file] is not None):
+                size, mtime = stats[file]
+                catalog[file] = {"size": size, "mtime": mtime, "nevents": nevents}
+        if catalog_path:
+            with open(catalog_path, "w") as fp:
+                json.dump(catalog, fp)
+
+    return {
+        file: catalog[file]["nevents"] if file in catalog else 0 for file in filelist
+    }
+
+
+def get_fileset(
+    client, datasets, parameters, save_to=None, load_from=None, catalog=None
+):
     if load_from:
         with open(load_from, "r") as fp:
             fileset = json.load(fp)
@@ -34,16 +76,15 @@ def get_fileset(client, datasets, parameters, save_to=None, load_from=None):
                 filelist = glob.glob(parameters["server"] + path + "/*.root")
                 # filelist = [glob.glob(parameters["server"] + path + "/*.root")[0]]
             # filelist = [filelist[0]]
-            futures = client.map(get_sum_wgts, filelist)
-            results = client.gather(futures)
-            cleaned_filelist = [r[0] for r in results if r[1] > 0]
-            # bad_files = [r[0] for r in results if r[1] <= 0]
-            nEvts = sum([r[1] for r in results if r[1] > 0])
+            nevents = update_file_catalog(client, filelist, catalog_path=catalog)
+            cleaned_filelist = [f for f in filelist if nevents[f] > 0]
+            nEvts = sum(nevents.values())
             # print(parameters["lumi"], cross_sections[sample], float(nEvts))
             mymetadata = {
                 "lumi_wgt": str(
                     parameters["lumi"] * cross_sections[sample] / float(nEvts)
                 ),
+                "nevents": nEvts,
                 "regions": ["z-peak", "h-sidebands", "h-peak"],
                 # "regions": ["h-sidebands", "h-peak"],
                 "channels": ["ggh_01j", "ggh_2j", "vbf", "vbf_01j", "vbf_2j"],
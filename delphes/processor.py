@@ -1,10 +1,11 @@
+import numpy as np
 import pandas as pd
 import awkward as ak
 import coffea.processor as processor
 
 from delphes.config.parameters import parameters
 from delphes.muons import fill_muons
-from delphes.jets import fill_jets, fill_gen_jets
+from delphes.jets import fill_jets, fill_gen_jets, jet_muon_cleaning
 
 
 class DimuonProcessorDelphes(processor.ProcessorABC):
@@ -39,31 +40,15 @@ class DimuonProcessorDelphes(processor.ProcessorABC):
 
         # Select muons
         muons = df[parameters["muon_branch"]]
-        muon_filter = (
+        muons = muons[
             (muons.pt > parameters["muon_pt_cut"])
             & (abs(muons.eta) < parameters["muon_eta_cut"])
             & (muons.IsolationVar < parameters["muon_iso_cut"])
-        )
-        nmuons = ak.to_pandas(ak.count(muons[muon_filter].pt, axis=1))
+        ]
+        nmuons = ak.to_numpy(ak.num(muons, axis=1))
 
         mu_map = {"PT": "pt", "Eta": "eta", "Phi": "phi", "Charge": "charge"}
-        muon_columns = ["PT", "Eta", "Phi", "Charge", "IsolationVar"]
-
-        # Convert one column at a time to preserve event indices in Pandas
-        muon_feature_list = []
-        for col in muon_columns:
-            muon_feature = df[parameters["muon_branch"]][col]
-            val = ak.to_pandas(muon_feature[muon_filter])
-            muon_feature_list.append(val)
-
-        muons = pd.concat(muon_feature_list, axis=1)
-        muons.columns = muon_columns
-        muons.rename(columns=mu_map, inplace=True)
-
-        mu1 = muons.loc[muons.pt.groupby("entry").idxmax()]
-        mu2 = muons.loc[muons.pt.groupby("entry").idxmin()]
-        mu1.index = mu1.index.droplevel("subentry")
-        mu2.index = mu2.index.droplevel("subentry")
+        mu1, mu2 = leading_objects(muons, mu_map, output.index)
         pass_leading_pt = mu1.pt > parameters["muon_leading_pt"]
         fill_muons(output, mu1, mu2)
 
@@ -75,7 +60,7 @@ class DimuonProcessorDelphes(processor.ProcessorABC):
             (electrons.pt > parameters["electron_pt_cut"])
             & (abs(electrons.eta) < parameters["electron_eta_cut"])
         ]
-        nelectrons = ak.to_pandas(ak.count(electrons.pt, axis=1))
+        nelectrons = ak.to_numpy(ak.num(electrons, axis=1))
 
         # Select jets
         jets = df[parameters["jet_branch"]]
@@ -84,36 +69,16 @@ class DimuonProcessorDelphes(processor.ProcessorABC):
             (mu_for_clean.pt > parameters["muon_pt_cut"])
             & (mu_for_clean.IsolationVar < parameters["muon_iso_cut"])
         ]
-        _, jet_mu_dr = jets.nearest(mu_for_clean, return_metric=True)
         jet_filter = (
-            ak.fill_none(jet_mu_dr > parameters["min_dr_mu_jet"], True)
+            jet_muon_cleaning(jets, mu_for_clean, parameters["min_dr_mu_jet"])
             & (jets.pt > parameters["jet_pt_cut"])
             & (abs(jets.eta) < parameters["jet_eta_cut"])
         )
-        njets = ak.to_pandas(ak.count(jets[jet_filter].pt, axis=1))
+        jets = jets[jet_filter]
+        njets = ak.to_numpy(ak.num(jets, axis=1))
 
         jet_map = {"PT": "pt", "Eta": "eta", "Phi": "phi", "Mass": "mass"}
-        jet_columns = ["PT", "Eta", "Phi", "Mass"]
-
-        jet_feature_list = []
-        for col in jet_columns:
-            jet_feature = df[parameters["jet_branch"]][col]
-            val = ak.to_pandas(jet_feature[jet_filter])
-            jet_feature_list.append(val)
-
-        jets = pd.concat(jet_feature_list, axis=1)
-        jets.columns = jet_columns
-        jets.rename(columns=jet_map, inplace=True)
-
-        jets = jets.sort_values(["entry", "pt"], ascending=[True, False])
-        jets.index = pd.MultiIndex.from_arrays(
-            [jets.index.get_level_values(0), jets.groupby(level=0).cumcount()],
-            names=["entry", "subentry"],
-        )
-        jet1 = jets.loc[pd.IndexSlice[:, 0], :]
-        jet2 = jets.loc[pd.IndexSlice[:, 1], :]
-        jet1.index = jet1.index.droplevel("subentry")
-        jet2.index = jet2.index.droplevel("subentry")
+        jet1, jet2 = leading_objects(jets, jet_map, output.index)
 
         fill_jets(output, jet1, jet2)
         fill_gen_jets(df, output)
@@ -122,9 +87,6 @@ class DimuonProcessorDelphes(processor.ProcessorABC):
         output["nmuons"] = nmuons
         output["nelectrons"] = nelectrons
         output["njets"] = njets
-        output[["nmuons", "nelectrons", "njets"]] = output[
-            ["nmuons", "nelectrons", "njets"]
-        ].fillna(0)
 
         output["event_selection"] = (
             (output.nmuons == 2)
@@ -170,3 +132,24 @@ class DimuonProcessorDelphes(processor.ProcessorABC):
 
     def postprocess(self, accumulator):
         return accumulator
+
+
+def leading_objects(objects, columns, index, nobjects=2):
+    """
+    Flat DataFrames of the leading objects (ordered by pT) in each event,
+    built directly from the jagged arrays. Events with fewer objects
+    have NaN values. `columns` maps branch names to output column names.
+    """
+    order = ak.argsort(objects.PT, axis=1, ascending=False)
+    objects = ak.pad_none(objects[order], nobjects, axis=1)
+    ret = []
+    for i in range(nobjects):
+        obj = ak.firsts(objects[:, i : i + 1])
+        values = {
+            name: ak.to_numpy(
+                ak.fill_none(ak.values_astype(obj[field], np.float64), np.nan)
+            )
+            for field, name in columns.items()
+        }
+        ret.append(pd.DataFrame(values, index=index))
+    return ret
@@ -204,6 +204,7 @@ parameters["muSFFileList"] = {
     ],
 }
 
+parameters["jec_cache_path"] = for_all_years("data/jec/cache/")
 parameters["zpt_weights_file"] = for_all_years("data/zpt_weights.histo.json")
 parameters["puid_sf_file"] = for_all_years("data/PUIDMaps.root")
 parameters["res_calib_path"] = for_all_years("data/res_calib/")
@@ -1,5 +1,9 @@
+import os
+import hashlib
+
 from coffea.jetmet_tools import CorrectedJetsFactory, JECStack
 from coffea.lookup_tools import extractor
+from coffea.util import save, load
 from nanoaod.config.jec_parameters import runs, jec_levels_mc, jec_levels_data
 from nanoaod.config.jec_parameters import jec_tags, jer_tags, jec_data_tags
 
@@ -28,8 +32,8 @@ def apply_jec(
                     factory = jec_factories_data[run]
         jets = factory.build(jets, lazy_cache=cache)
 
-    # TODO: only consider nuisances that are defined in run parameters
     # Compute JEC uncertainties
+    # (only for the sources defined in run parameters, see jec_factories)
     if is_mc and do_jecunc:
         jets = jec_factories["junc"].build(jets, lazy_cache=cache)
 
@@ -116,7 +120,42 @@ def get_name_map(stack):
     return name_map
 
 
-def jec_factories(year):
+def jec_lookups(year, weight_sets, unc_sources=None, cache_path=None):
+    # Parsing the txt files is slow, so the resulting lookup tables are
+    # converted once and stored on disk. The cache is invalidated if any
+    # of the input files or the list of uncertainty sources changes.
+    files = sorted(set(ws.split(" ")[-1] for ws in weight_sets))
+    cache_file = None
+    if cache_path is not None:
+        digest = hashlib.md5()
+        for f in files:
+            digest.update(f"{f}:{os.path.getmtime(f)}:{os.path.getsize(f)}".encode())
+        digest.update(str(sorted(unc_sources) if unc_sources else None).encode())
+        cache_file = f"{cache_path}/jec_lookups_{year}_{digest.hexdigest()}.coffea"
+        if os.path.exists(cache_file):
+            return load(cache_file)
+
+    jetext = extractor()
+    jetext.add_weight_sets(weight_sets)
+    jetext.finalize()
+    jet_evaluator = jetext.make_evaluator()
+
+    lookups = {}
+    for key in jet_evaluator.keys():
+        if "UncertaintySources" in key and (unc_sources is not None):
+            # keep only uncertainty sources that we are going to use
+            source = key.split("UncertaintySources_AK4PFchs_")[-1]
+            if source not in unc_sources:
+                continue
+        lookups[key] = jet_evaluator[key]
+
+    if cache_file is not None:
+        os.makedirs(cache_path, exist_ok=True)
+        save(lookups, cache_file)
+    return lookups
+
+
+def jec_factories(year, unc_sources=None, cache_path=None):
 
     weight_sets = jec_weight_sets(year)
     names = jec_names_and_sources(year)
@@ -125,11 +164,12 @@ def jec_factories(year):
     jec_factories_data = {}
 
     # Prepare evaluators for JEC, JER and their systematics
-    jetext = extractor()
-    jetext.add_weight_sets(weight_sets["jec_weight_sets"])
-    jetext.add_weight_sets(weight_sets["jec_weight_sets_data"])
-    jetext.finalize()
-    jet_evaluator = jetext.make_evaluator()
+    jet_evaluator = jec_lookups(
+        year,
+        weight_sets["jec_weight_sets"] + weight_sets["jec_weight_sets_data"],
+        unc_sources=unc_sources,
+        cache_path=cache_path,
+    )
 
     stacks_def = {
         "jec_stack": ["jec_names"],
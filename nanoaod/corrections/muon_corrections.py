@@ -0,0 +1,115 @@
+import numpy as np
+import awkward as ak
+
+from nanoaod.corrections.geofit import factors as geofit_factors
+from nanoaod.corrections.geofit import eta_edges as geofit_eta_edges
+
+
+def apply_muon_corrections(df, year, do_fsr=True, do_geofit=True):
+    # FSR recovery and GeoFit correction computed in a single pass
+    # over flat muon arrays. The results are wrapped back into jagged
+    # arrays using the original muon counts.
+    counts = ak.num(df.Muon.pt, axis=1)
+
+    pt = ak.to_numpy(ak.flatten(df.Muon.pt))
+    eta = ak.to_numpy(ak.flatten(df.Muon.eta))
+    phi = ak.to_numpy(ak.flatten(df.Muon.phi))
+    mass = ak.to_numpy(ak.flatten(df.Muon.mass))
+    iso = ak.to_numpy(ak.flatten(df.Muon.pfRelIso04_all))
+
+    pt_fsr = pt.copy()
+    eta_fsr = eta.copy()
+    phi_fsr = phi.copy()
+    mass_fsr = mass.copy()
+    iso_fsr = iso.copy()
+    has_fsr = np.zeros(len(pt), dtype=bool)
+
+    # ------------------------------------------------------------#
+    # FSR recovery
+    # ------------------------------------------------------------#
+    if do_fsr:
+        fsr_idx = ak.to_numpy(ak.flatten(df.Muon.fsrPhotonIdx))
+        # indices of muons that have a matched photon
+        idx = np.flatnonzero(fsr_idx >= 0)
+
+        # position of the matched photon in the flat photon arrays
+        ph_counts = ak.to_numpy(ak.num(df.FsrPhoton.pt, axis=1))
+        ph_starts = np.cumsum(ph_counts) - ph_counts
+        mu_event = np.repeat(np.arange(len(ph_counts)), ak.to_numpy(counts))
+        ph_idx = ph_starts[mu_event[idx]] + fsr_idx[idx]
+
+        ph_pt = ak.to_numpy(ak.flatten(df.FsrPhoton.pt))[ph_idx]
+        ph_eta = ak.to_numpy(ak.flatten(df.FsrPhoton.eta))[ph_idx]
+        ph_phi = ak.to_numpy(ak.flatten(df.FsrPhoton.phi))[ph_idx]
+        ph_iso = ak.to_numpy(ak.flatten(df.FsrPhoton.relIso03))[ph_idx]
+        ph_dr_et2 = ak.to_numpy(ak.flatten(df.FsrPhoton.dROverEt2))[ph_idx]
+
+        passing = (
+            (ph_iso < 1.8)
+            & (ph_dr_et2 < 0.012)
+            & (ph_pt / pt[idx] < 0.4)
+            & (np.abs(ph_eta) < 2.4)
+        )
+        idx = idx[passing]
+        ph_pt = ph_pt[passing]
+        ph_eta = ph_eta[passing]
+        ph_phi = ph_phi[passing]
+
+        mu_pt = pt[idx]
+        mu_px = mu_pt * np.cos(phi[idx])
+        mu_py = mu_pt * np.sin(phi[idx])
+        mu_pz = mu_pt * np.sinh(eta[idx])
+        mu_e = np.sqrt(mu_px**2 + mu_py**2 + mu_pz**2 + mass[idx] ** 2)
+
+        ph_px = ph_pt * np.cos(ph_phi)
+        ph_py = ph_pt * np.sin(ph_phi)
+        ph_pz = ph_pt * np.sinh(ph_eta)
+        ph_e = np.sqrt(ph_px**2 + ph_py**2 + ph_pz**2)
+
+        px = mu_px + ph_px
+        py = mu_py + ph_py
+        pz = mu_pz + ph_pz
+        e = mu_e + ph_e
+
+        pt_dressed = np.sqrt(px**2 + py**2)
+        pt_fsr[idx] = pt_dressed
+        eta_fsr[idx] = np.arcsinh(pz / pt_dressed)
+        phi_fsr[idx] = np.arctan2(py, px)
+        mass_fsr[idx] = np.sqrt(e**2 - px**2 - py**2 - pz**2)
+        iso_fsr[idx] = (iso[idx] * mu_pt - ph_pt) / pt_dressed
+        has_fsr[idx] = True
+
+    # ------------------------------------------------------------#
+    # GeoFit correction (only for muons without FSR photons)
+    # ------------------------------------------------------------#
+    pt_gf = pt_fsr.copy()
+    if do_geofit:
+        d0_BS_charge = ak.to_numpy(ak.flatten(df.Muon.dxybs)) * ak.to_numpy(
+            ak.flatten(df.Muon.charge)
+        )
+        idx = np.flatnonzero(~has_fsr & (np.abs(d0_BS_charge) < 999999.0))
+        factors = np.array(
+            [geofit_factors[year][f"eta_{i}"] for i in [1, 2, 3]], dtype=float
+        )
+        eta_bin = np.digitize(np.abs(eta_fsr[idx]), geofit_eta_edges)
+        pt_gf[idx] = (
+            pt_fsr[idx]
+            - factors[eta_bin] * d0_BS_charge[idx] * pt_fsr[idx] ** 2 / 10000.0
+        )
+
+    # ------------------------------------------------------------#
+    # Wrap the results back into jagged arrays
+    # ------------------------------------------------------------#
+    df["Muon", "pt_fsr"] = ak.unflatten(pt_fsr, counts)
+    df["Muon", "eta_fsr"] = ak.unflatten(eta_fsr, counts)
+    df["Muon", "phi_fsr"] = ak.unflatten(phi_fsr, counts)
+    df["Muon", "mass_fsr"] = ak.unflatten(mass_fsr, counts)
+    df["Muon", "iso_fsr"] = ak.unflatten(iso_fsr, counts)
+    if do_geofit:
+        df["Muon", "pt_gf"] = ak.unflatten(pt_gf, counts)
+
+    # FSR-corrected kinematics become the default muon kinematics
+    df["Muon", "pt"] = df.Muon.pt_fsr
+    df["Muon", "eta"] = df.Muon.eta_fsr
+    df["Muon", "phi"] = df.Muon.phi_fsr
+    df["Muon", "pfRelIso04_all"] = df.Muon.iso_fsr
@@ -1,59 +1,45 @@
 import numpy as np
+import awkward as ak
 import uproot
 
+# Higgs pT is clipped at the end of the graph range for each jet bin
+nnlops_pt_max = [125.0, 625.0, 800.0, 925.0]
 
-class NNLOPS_Evaluator(object):
-    def __init__(self, input_path):
-        with uproot.open(input_path) as f:
-            self.ratio_0jet = {
-                "mcatnlo": f["gr_NNLOPSratio_pt_mcatnlo_0jet"],
-                "powheg": f["gr_NNLOPSratio_pt_powheg_0jet"],
-            }
-            self.ratio_1jet = {
-                "mcatnlo": f["gr_NNLOPSratio_pt_mcatnlo_1jet"],
-                "powheg": f["gr_NNLOPSratio_pt_powheg_1jet"],
-            }
-            self.ratio_2jet = {
-                "mcatnlo": f["gr_NNLOPSratio_pt_mcatnlo_2jet"],
-                "powheg": f["gr_NNLOPSratio_pt_powheg_2jet"],
-            }
-            self.ratio_3jet = {
-                "mcatnlo": f["gr_NNLOPSratio_pt_mcatnlo_3jet"],
-                "powheg": f["gr_NNLOPSratio_pt_powheg_3jet"],
-            }
 
-    def evaluate(self, hig_pt, njets, mode):
-        result = np.ones(len(hig_pt), dtype=float)
-        hig_pt = np.array(hig_pt)
-        njets = np.array(njets)
-        result[njets == 0] = np.interp(
-            np.minimum(hig_pt[njets == 0], 125.0),
-            self.ratio_0jet[mode].member("fX"),
-            self.ratio_0jet[mode].member("fY"),
-        )
-        result[njets == 1] = np.interp(
-            np.minimum(hig_pt[njets == 1], 625.0),
-            self.ratio_1jet[mode].member("fX"),
-            self.ratio_1jet[mode].member("fY"),
-        )
-        result[njets == 2] = np.interp(
-            np.minimum(hig_pt[njets == 2], 800.0),
-            self.ratio_2jet[mode].member("fX"),
-            self.ratio_2jet[mode].member("fY"),
-        )
-        result[njets > 2] = np.interp(
-            np.minimum(hig_pt[njets > 2], 925.0),
-            self.ratio_3jet[mode].member("fX"),
-            self.ratio_3jet[mode].member("fY"),
-        )
-        return result
+def nnlops_lookups(parameters):
+    # Graphs are read only once and stored as contiguous arrays,
+    # so that the lookups can be shipped to workers with the processor
+    lookups = {}
+    with uproot.open(parameters["nnlops_file"]) as f:
+        for mode in ["mcatnlo", "powheg"]:
+            lookups[mode] = []
+            for njets in range(4):
+                graph = f[f"gr_NNLOPSratio_pt_{mode}_{njets}jet"]
+                lookups[mode].append(
+                    (
+                        np.ascontiguousarray(graph.member("fX"), dtype=np.float64),
+                        np.ascontiguousarray(graph.member("fY"), dtype=np.float64),
+                    )
+                )
+    return lookups
 
 
-def nnlops_weights(df, numevents, parameters, dataset):
-    nnlops = NNLOPS_Evaluator(parameters["nnlops_file"])
+def nnlops_evaluator(lookups, hig_pt, njets, mode):
+    hig_pt = np.asarray(hig_pt, dtype=np.float64)
+    njets = np.minimum(np.asarray(njets), 3)
+    result = np.ones(len(hig_pt), dtype=float)
+    for ijet, (x, y) in enumerate(lookups[mode]):
+        mask = njets == ijet
+        result[mask] = np.interp(np.minimum(hig_pt[mask], nnlops_pt_max[ijet]), x, y)
+    return result
+
+
+def nnlops_weights(df, numevents, lookups, dataset):
     nnlopsw = np.ones(numevents, dtype=float)
+    hig_pt = ak.to_numpy(df.HTXS.Higgs_pt)
+    njets = ak.to_numpy(df.HTXS.njets30)
     if "amc" in dataset:
-        nnlopsw = nnlops.evaluate(df.HTXS.Higgs_pt, df.HTXS.njets30, "mcatnlo")
+        nnlopsw = nnlops_evaluator(lookups, hig_pt, njets, "mcatnlo")
     elif "powheg" in dataset:
-        nnlopsw = nnlops.evaluate(df.HTXS.Higgs_pt, df.HTXS.njets30, "powheg")
+        nnlopsw = nnlops_evaluator(lookups, hig_pt, njets, "powheg")
     return nnlopsw
@@ -1,64 +1,92 @@
+import numpy as np
 import pandas as pd
 
+# Polynomial coefficients in increasing order of power,
+# as expected by np.polynomial.polynomial.polyval
+qgl_coefficients = {
+    "herwig": {
+        "light": np.array([0.596896, 1.86096, -2.45101, 1.16636]),
+        "gluon": np.array(
+            [
+                0.919838,
+                3.41825,
+                -19.2979,
+                56.7714,
+                -72.8429,
+                -16.7487,
+                111.455,
+                -63.2397,
+            ]
+        ),
+    },
+    "pythia": {
+        "light": np.array([0.981581, -0.255505, 0.929524, -0.666978]),
+        "gluon": np.array(
+            [
+                0.612992,
+                6.27,
+                -34.3663,
+                92.8668,
+                -99.927,
+                -21.1421,
+                113.218,
+                -55.7067,
+            ]
+        ),
+    },
+}
+
+# Flavour category codes
+NO_WEIGHT, LIGHT, GLUON = 0, 1, 2
+
 
 def qgl_weights(jet1, jet2, isHerwig, output, variables, njets):
-    qgl = pd.DataFrame(index=output.index, columns=["wgt", "wgt_down"]).fillna(1.0)
+    wgt1, wgt2 = get_qgl_weights(jet1, jet2, isHerwig)
 
-    qgl1 = get_qgl_weights(jet1, isHerwig).fillna(1.0)
-    qgl2 = get_qgl_weights(jet2, isHerwig).fillna(1.0)
-    qgl.wgt *= qgl1 * qgl2
+    # Events without two selected jets are not reweighted,
+    # except for events with exactly one jet (see below)
+    wgt = pd.Series(np.nan, index=output.index, dtype=np.float64)
+    both_jets = jet1.index.intersection(jet2.index)
+    wgt.loc[both_jets] = (
+        pd.Series(wgt1, index=jet1.index).loc[both_jets].values
+        * pd.Series(wgt2, index=jet2.index).loc[both_jets].values
+    )
 
-    qgl.wgt[variables.njets == 1] = 1.0
+    wgt[variables.njets == 1] = 1.0
     selected = output.event_selection & (njets > 2)
-    qgl.wgt = qgl.wgt / qgl.wgt[selected].mean()
+    wgt = wgt / wgt[selected].mean()
 
-    qgl = qgl.fillna(1.0)
+    wgt = wgt.fillna(1.0)
+    wgt_down = pd.Series(1.0, index=output.index, dtype=np.float64)
 
-    wgts = {"nom": qgl.wgt, "up": qgl.wgt * qgl.wgt, "down": qgl.wgt_down}
+    wgts = {"nom": wgt, "up": wgt * wgt, "down": wgt_down}
     return wgts
 
 
-def get_qgl_weights(jet, isHerwig):
-    df = pd.DataFrame(index=jet.index, columns=["weights"])
+def flavour_categories(jet):
+    flavour = jet.partonFlavour.to_numpy()
+    qgl = jet.qgl.to_numpy()
 
-    wgt_mask = (jet.partonFlavour != 0) & (abs(jet.eta) < 2) & (jet.qgl > 0)
-    light = wgt_mask & (abs(jet.partonFlavour) < 4)
-    gluon = wgt_mask & (jet.partonFlavour == 21)
+    wgt_mask = (flavour != 0) & (np.abs(jet.eta.to_numpy()) < 2) & (qgl > 0)
+    return np.select(
+        [wgt_mask & (np.abs(flavour) < 4), wgt_mask & (flavour == 21)],
+        [LIGHT, GLUON],
+        default=NO_WEIGHT,
+    ).astype(np.int8)
 
-    qgl = jet.qgl
 
-    if isHerwig:
-        df.weights[light] = (
-            1.16636 * qgl[light] ** 3
-            - 2.45101 * qgl[light] ** 2
-            + 1.86096 * qgl[light]
-            + 0.596896
-        )
-        df.weights[gluon] = (
-            -63.2397 * qgl[gluon] ** 7
-            + 111.455 * qgl[gluon] ** 6
-            - 16.7487 * qgl[gluon] ** 5
-            - 72.8429 * qgl[gluon] ** 4
-            + 56.7714 * qgl[gluon] ** 3
-            - 19.2979 * qgl[gluon] ** 2
-            + 3.41825 * qgl[gluon]
-            + 0.919838
-        )
-    else:
-        df.weights[light] = (
-            -0.666978 * qgl[light] ** 3
-            + 0.929524 * qgl[light] ** 2
-            - 0.255505 * qgl[light]
-            + 0.981581
-        )
-        df.weights[gluon] = (
-            -55.7067 * qgl[gluon] ** 7
-            + 113.218 * qgl[gluon] ** 6
-            - 21.1421 * qgl[gluon] ** 5
-            - 99.927 * qgl[gluon] ** 4
-            + 92.8668 * qgl[gluon] ** 3
-            - 34.3663 * qgl[gluon] ** 2
-            + 6.27 * qgl[gluon]
-            + 0.612992
+def get_qgl_weights(jet1, jet2, isHerwig):
+    # Both leading jets are evaluated together on flat arrays
+    coefficients = qgl_coefficients["herwig" if isHerwig else "pythia"]
+
+    qgl = np.concatenate([jet1.qgl.to_numpy(), jet2.qgl.to_numpy()]).astype(np.float64)
+    category = np.concatenate([flavour_categories(jet1), flavour_categories(jet2)])
+
+    weights = np.ones(len(qgl), dtype=np.float64)
+    for code, flavour in [(LIGHT, "light"), (GLUON, "gluon")]:
+        mask = category == code
+        weights[mask] = np.polynomial.polynomial.polyval(
+            qgl[mask], coefficients[flavour]
         )
-    return df.weights
+
+    return weights[: len(jet1)], weights[len(jet1) :]
@@ -1,5 +1,4 @@
 import numpy as np
-from coffea.lookup_tools import dense_lookup
 
 # STXS   TOT,  PTH200,  Mjj60 , Mjj120 , Mjj350 ,
 # Mjj700, Mjj1000, Mjj1500,  25, JET01
@@ -217,30 +216,27 @@ powheg_xsec = {
 
 
 def stxs_lookups():
-    stxs_acc_lookups = {}
-    edges = np.array([])
-    values = np.array([])
-    for i in range(10):
-        for k, v in stxs_acc.items():
-            edges = np.append(edges, k)
-            values = np.append(values, v[i])
-        stxs_acc_lookups[i] = dense_lookup.dense_lookup(values, [edges])
-        stxs_acc_lookups[i]._axes = stxs_acc_lookups[i]._axes[0]
-    powheg_xsec_lookup = dense_lookup.dense_lookup(
-        np.array(list(powheg_xsec.values())), [np.array(list(powheg_xsec.keys()))]
-    )
-    powheg_xsec_lookup._axes = powheg_xsec_lookup._axes[0]
-    return stxs_acc_lookups, powheg_xsec_lookup
+    # Relative uncertainty for each STXS bin (rows) and source (columns),
+    # stored as one contiguous matrix together with the sorted bin codes
+    stxs_bins = np.array(sorted(stxs_acc.keys()), dtype=np.int64)
+    acc = np.array([stxs_acc[b] for b in stxs_bins], dtype=np.float64)
+    xsec = np.array([powheg_xsec[b] for b in stxs_bins], dtype=np.float64)
+    rel_uncert = acc * np.array(uncert_deltas)[np.newaxis, :] / xsec[:, np.newaxis]
+    return {"bins": stxs_bins, "rel_uncert": np.ascontiguousarray(rel_uncert)}
 
 
-def stxs_uncert(source, event_STXS, Nsigma, stxs_acc_lookups, powheg_xsec_lookup):
+def stxs_uncert(event_STXS, lookups):
     # vbf_uncert_stage_1_1
-    # return a single weight for a given souce
-    if source < 10:
-        delta_var = stxs_acc_lookups[source](event_STXS) * uncert_deltas[source]
-        ret = np.ones(len(event_STXS), dtype=float) + Nsigma * (
-            delta_var / powheg_xsec_lookup(event_STXS)
-        )
-        return ret
-    else:
-        return np.zeros(len(event_STXS), dtype=float)
+    # returns weights for all sources at once, shape (nevents, nsources, 2),
+    # where the last axis corresponds to (up, down) variations
+    event_STXS = np.asarray(event_STXS, dtype=np.int64)
+    bins = lookups["bins"]
+    rel_uncert = lookups["rel_uncert"]
+
+    idx = np.clip(np.searchsorted(bins, event_STXS), 0, len(bins) - 1)
+    found = bins[idx] == event_STXS
+
+    # events outside of the VBF STXS bins are not varied
+    delta = np.where(found[:, np.newaxis], rel_uncert[idx], 0.0)
+    nsigma = np.array([1.0, -1.0])
+    return 1.0 + delta[:, :, np.newaxis] * nsigma[np.newaxis, np.newaxis, :]
@@ -0,0 +1,50 @@
+import json
+import numpy as np
+import awkward as ak
+
+
+class LumiMaskLookup(object):
+    """
+    Golden JSON parsed once into a sorted array of (run, lumi) intervals.
+    Each (run, lumi) pair is packed into a single 64-bit key, so that
+    the mask can be evaluated with a single np.searchsorted call.
+    """
+
+    def __init__(self, json_path):
+        with open(json_path) as f:
+            golden = json.load(f)
+
+        starts = []
+        ends = []
+        for run, lumi_ranges in golden.items():
+            for lumi_lo, lumi_hi in lumi_ranges:
+                starts.append(self.make_key(int(run), lumi_lo))
+                ends.append(self.make_key(int(run), lumi_hi))
+
+        order = np.argsort(starts)
+        self.starts = np.array(starts, dtype=np.uint64)[order]
+        self.ends = np.array(ends, dtype=np.uint64)[order]
+
+    @staticmethod
+    def make_key(run, lumi):
+        run = np.asarray(run, dtype=np.uint64)
+        lumi = np.asarray(lumi, dtype=np.uint64)
+        return (run << np.uint64(32)) | lumi
+
+    def __call__(self, runs, lumis):
+        keys = self.make_key(ak.to_numpy(runs), ak.to_numpy(lumis))
+        if len(self.starts) == 0:
+            return np.zeros(len(keys), dtype=bool)
+        idx = np.searchsorted(self.starts, keys, side="right") - 1
+        inside = idx >= 0
+        idx[~inside] = 0
+        return inside & (keys <= self.ends[idx])
+
+
+def hlt_decision(df, hlt_paths):
+    # OR of all available HLT paths, computed directly on boolean arrays
+    hlt = np.zeros(len(df), dtype=bool)
+    for path in hlt_paths:
+        if path in df.HLT.fields:
+            hlt |= ak.to_numpy(df.HLT[path]).astype(bool)
+    return hlt
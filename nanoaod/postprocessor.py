@@ -3,8 +3,10 @@ import os
 import dask.dataframe as dd
 import pandas as pd
 import numpy as np
-import pickle
 from python.io import load_pandas_from_parquet
+from python.categorizer import categorize
+from python.scalers import load_scalers, normalize
+from python.inference import load_dnn, load_bdt
 
 os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 pd.options.mode.chained_assignment = None
@@ -110,9 +112,9 @@ def load_dataframe(client, parameters, inputs=[], timer=None):
         df["dataset"] = df["s"]
     if ("region" not in df.columns) and ("r" in df.columns):
         df["region"] = df["r"]
-    for v in parameters["syst_variations"]:
-        if (f"channel {v}" not in df.columns) and (f"c {v}" in df.columns):
-            df[f"channel {v}"] = df[f"c {v}"]
+
+    # Assign channels for all variations once, lazily per partition
+    df = categorize(df, parameters)
 
     keep_columns = ["dataset", "year", "region"]
     keep_columns += [f"channel {v}" for v in parameters["syst_variations"]]
@@ -172,17 +174,6 @@ def prepare_features(df, parameters, variation="nominal", add_year=True):
 
 
 def dnn_evaluation(df, variation, model, parameters):
-    import tensorflow as tf
-    from tensorflow.keras.models import load_model
-
-    config = tf.compat.v1.ConfigProto(
-        intra_op_parallelism_threads=1,
-        inter_op_parallelism_threads=1,
-        allow_soft_placement=True,
-        device_count={"CPU": 1},
-    )
-    tf.compat.v1.logging.set_verbosity(tf.compat.v1.logging.FATAL)
-    sess = tf.compat.v1.Session(config=config)
     if parameters["do_massscan"]:
         mass_shift = parameters["mass"] - 125.0
     features = prepare_features(df, parameters, variation, add_year=True)
@@ -195,31 +186,30 @@ def dnn_evaluation(df, variation, model, parameters):
     if df.shape[0] == 0:
         return df[score_name]
 
-    with sess:
-        nfolds = 4
-        for i in range(nfolds):
-            # FIXME
-            label = f"allyears_jul7_{i}"
+    nfolds = 4
+    for i in range(nfolds):
+        # FIXME
+        label = f"allyears_jul7_{i}"
 
-            # train_folds = [(i + f) % nfolds for f in [0, 1]]
-            # val_folds = [(i + f) % nfolds for f in [2]]
-            eval_folds = [(i + f) % nfolds for f in [3]]
+        # train_folds = [(i + f) % nfolds for f in [0, 1]]
+        # val_folds = [(i + f) % nfolds for f in [2]]
+        eval_folds = [(i + f) % nfolds for f in [3]]
 
-            eval_filter = df.event.mod(nfolds).isin(eval_folds)
+        eval_filter = df.event.mod(nfolds).isin(eval_folds)
 
-            scalers_path = f"{parameters['models_path']}/{model}/scalers_{label}.npy"
-            scalers = np.load(scalers_path)
-            model_path = f"{parameters['models_path']}/{model}/dnn_{label}.h5"
-            dnn_model = load_model(model_path)
-            df_i = df.loc[eval_filter, :]
-            if df_i.shape[0] == 0:
-                continue
-            df_i.loc[df_i.region != "h-peak", "dimuon_mass"] = 125.0
-            if parameters["do_massscan"]:
-                df_i.loc[:, "dimuon_mass"] = df_i["dimuon_mass"] - mass_shift
-            df_i = (df_i[features] - scalers[0]) / scalers[1]
-            prediction = np.array(dnn_model.predict(df_i)).ravel()
-            df.loc[eval_filter, score_name] = np.arctanh((prediction))
+        scalers_path = f"{parameters['models_path']}/{model}/scalers_{label}.npy"
+        scalers = load_scalers(scalers_path)
+        # ONNX export if available, so that TensorFlow is not needed
+        dnn_model = load_dnn(f"{parameters['models_path']}/{model}/dnn_{label}")
+        df_i = df.loc[eval_filter, :]
+        if df_i.shape[0] == 0:
+            continue
+        df_i.loc[df_i.region != "h-peak", "dimuon_mass"] = 125.0
+        if parameters["do_massscan"]:
+            df_i.loc[:, "dimuon_mass"] = df_i["dimuon_mass"] - mass_shift
+        x = normalize(df_i[features].to_numpy(dtype=np.float32, copy=True), scalers)
+        prediction = np.array(dnn_model.predict(x)).ravel()
+        df.loc[eval_filter, score_name] = np.arctanh((prediction))
     return df[score_name]
 
 
@@ -246,27 +236,22 @@ def bdt_evaluation(df, variation, model, parameters):
 
         eval_filter = df.event.mod(nfolds).isin(eval_folds)
         scalers_path = f"{parameters['models_path']}/{model}/scalers_{label}.npy"
-        scalers = np.load(scalers_path)
-        model_path = (
-            f"{parameters['models_path']}/{model}/" f"BDT_model_earlystop50_{label}.pkl"
+        scalers = load_scalers(scalers_path)
+        # XGBoost JSON export if available, independent of xgboost version
+        bdt_model = load_bdt(
+            f"{parameters['models_path']}/{model}/BDT_model_earlystop50_{label}"
         )
-
-        bdt_model = pickle.load(open(model_path, "rb"))
         df_i = df[eval_filter]
         if df_i.shape[0] == 0:
             continue
         df_i.loc[df_i.region != "h-peak", "dimuon_mass"] = 125.0
         if parameters["do_massscan"]:
             df_i.loc[:, "dimuon_mass"] = df_i["dimuon_mass"] - mass_shift
-        df_i = (df_i[features] - scalers[0]) / scalers[1]
-        if len(df_i) > 0:
+        x = normalize(df_i[features].to_numpy(dtype=np.float32, copy=True), scalers)
+        if len(x) > 0:
             if "multiclass" in model:
-                prediction = np.array(
-                    bdt_model.predict_proba(df_i.values)[:, 5]
-                ).ravel()
+                prediction = np.array(bdt_model.predict_proba(x)[:, 5]).ravel()
             else:
-                prediction = np.array(
-                    bdt_model.predict_proba(df_i.values)[:, 1]
-                ).ravel()
+                prediction = np.array(bdt_model.predict_proba(x)[:, 1]).ravel()
             df.loc[eval_filter, score_name] = np.arctanh((prediction))
     return df[score_name]
@@ -17,6 +17,8 @@ import tqdm
 from sklearn.metrics import roc_curve
 from math import sqrt
 
+from python.mva_binning import bins_from_target_yields, asimov_significance2
+
 stderr = sys.stderr
 sys.stderr = open(os.devnull, "w")
 import keras  # noqa: E402
@@ -698,7 +700,6 @@ def rebin(df, model, args):
     else:
         years = [args["year"]]
     var = f"score_{model}"
-    df = df.sort_values(by=[var], ascending=False)
     bnd = {}
     target_yields = {
         "2016": [
@@ -759,22 +760,15 @@ def rebin(df, model, args):
         for c in df.c.unique():
             bnd[year][c] = {}
             for v in df.v.unique():
-                bin_sum = 0
-                boundaries = []
-                idx_left = 0
-                idx_right = len(target_yields[year]) - 1
                 if year == "combined":
                     filter = (df.c == c) & (df.v == v)
                 else:
                     filter = (df.c == c) & (df.v == v) & (df.year == int(year))
-                for idx, row in df[filter].iterrows():
-                    bin_sum += row["wgt_nominal"]
-                    if bin_sum >= target_yields[year][idx_right]:
-                        boundaries.append(round(row[var], 3))
-                        bin_sum = 0
-                        idx_left += 1
-                        idx_right -= 1
-                bnd[year][c][v] = sorted([0, 5.0] + boundaries)
+                bnd[year][c][v] = bins_from_target_yields(
+                    df.loc[filter, var],
+                    df.loc[filter, "wgt_nominal"],
+                    target_yields[year],
+                )
     # print(model, bnd)
     return bnd
 
@@ -793,14 +787,9 @@ def get_asimov_significance(df, model, args):
         binning = binning_all[year]["vbf"]["nominal"]
         S = df[(df.cls == "signal") & (df.r == "h-peak") & (df.year == int(year))]
         B = df[(df.cls == "background") & (df.r == "h-peak") & (df.year == int(year))]
-        for ibin in range(len(binning) - 1):
-            bin_lo = binning[ibin]
-            bin_hi = binning[ibin + 1]
-            sig_yield = S[(S[var] >= bin_lo) & (S[var] < bin_hi)]["wgt_nominal"].sum()
-            bkg_yield = B[(B[var] >= bin_lo) & (B[var] < bin_hi)]["wgt_nominal"].sum()
-            # print(f'{year} Bin {ibin}: s={sig_yield}, b={bkg_yield},"\
-            #     f" sigma={sig_yield/sqrt(sig_yield+bkg_yield)}')
-            significance2 += (sig_yield * sig_yield) / (sig_yield + bkg_yield)
+        sig_yield, _ = np.histogram(S[var], bins=binning, weights=S["wgt_nominal"])
+        bkg_yield, _ = np.histogram(B[var], bins=binning, weights=B["wgt_nominal"])
+        significance2 += asimov_significance2(sig_yield, bkg_yield).sum()
     print(f"Model {model}: significance = {sqrt(significance2)}")
     return sqrt(significance2)
 
@@ -9,18 +9,17 @@ import coffea.processor as processor
 from coffea.lookup_tools import extractor
 from coffea.lookup_tools import txt_converters, rochester_lookup
 from coffea.btag_tools import BTagScaleFactor
-from coffea.lumi_tools import LumiMask
 
 from python.timer import Timer
 from nanoaod.weights import Weights
+from nanoaod.event_filters import LumiMaskLookup, hlt_decision
 from nanoaod.corrections.pu_reweight import pu_lookups, pu_evaluator
 from nanoaod.corrections.l1prefiring_weights import l1pf_weights
 from nanoaod.corrections.rochester import apply_roccor
-from nanoaod.corrections.fsr_recovery import fsr_recovery
-from nanoaod.corrections.geofit import apply_geofit
+from nanoaod.corrections.muon_corrections import apply_muon_corrections
 from nanoaod.corrections.jec import jec_factories, apply_jec
 from nanoaod.corrections.lepton_sf import musf_lookup, musf_evaluator
-from nanoaod.corrections.nnlops import nnlops_weights
+from nanoaod.corrections.nnlops import nnlops_lookups, nnlops_weights
 from nanoaod.corrections.stxs_uncert import stxs_uncert, stxs_lookups
 from nanoaod.corrections.lhe_weights import lhe_weights
 from nanoaod.corrections.qgl_weights import qgl_weights
@@ -176,16 +175,10 @@ class DimuonProcessor(processor.ProcessorABC):
 
         else:
             # For Data: apply Lumi mask
-            lumi_info = LumiMask(self.parameters["lumimask"])
-            mask = lumi_info(df.run, df.luminosityBlock)
+            mask = self.lumi_mask(df.run, df.luminosityBlock)
 
         # Apply HLT to both Data and MC
-        hlt_columns = [c for c in self.parameters["hlt"] if c in df.HLT.fields]
-        hlt = ak.to_pandas(df.HLT[hlt_columns])
-        if len(hlt_columns) == 0:
-            hlt = False
-        else:
-            hlt = hlt[hlt_columns].sum(axis=1)
+        hlt = hlt_decision(df, self.parameters["hlt"])
 
         if self.timer:
             self.timer.add_checkpoint("HLT, lumimask, PU weights")
@@ -220,22 +213,14 @@ class DimuonProcessor(processor.ProcessorABC):
             # effect on significance, but it's better to have them
             # implemented in the future
 
-            # FSR recovery
-            if self.do_fsr:
-                has_fsr = fsr_recovery(df)
-                df["Muon", "pt"] = df.Muon.pt_fsr
-                df["Muon", "eta"] = df.Muon.eta_fsr
-                df["Muon", "phi"] = df.Muon.phi_fsr
-                df["Muon", "pfRelIso04_all"] = df.Muon.iso_fsr
-
-            # if FSR was applied, 'pt_fsr' will be corrected pt
-            # if FSR wasn't applied, just copy 'pt' to 'pt_fsr'
-            df["Muon", "pt_fsr"] = df.Muon.pt
-
-            # GeoFit correction
-            if self.do_geofit and ("dxybs" in df.Muon.fields):
-                apply_geofit(df, self.year, ~has_fsr)
-                df["Muon", "pt"] = df.Muon.pt_fsr
+            # FSR recovery and GeoFit correction (fused kernel).
+            # If FSR wasn't applied, 'pt_fsr' is a copy of 'pt'.
+            apply_muon_corrections(
+                df,
+                self.year,
+                do_fsr=self.do_fsr,
+                do_geofit=self.do_geofit and ("dxybs" in df.Muon.fields),
+            )
 
             if self.timer:
                 self.timer.add_checkpoint("Muon corrections")
@@ -391,7 +376,7 @@ class DimuonProcessor(processor.ProcessorABC):
         if is_mc:
             do_nnlops = self.do_nnlops and ("ggh" in dataset)
             if do_nnlops:
-                nnlopsw = nnlops_weights(df, numevents, self.parameters, dataset)
+                nnlopsw = nnlops_weights(df, numevents, self.nnlops_lookups, dataset)
                 weights.add_weight("nnlops", nnlopsw)
             else:
                 weights.add_weight("nnlops", how="dummy")
@@ -439,23 +424,16 @@ class DimuonProcessor(processor.ProcessorABC):
                 and ("stage1_1_fine_cat_pTjet30GeV" in df.HTXS.fields)
             )
             if do_thu:
+                thu_wgts = stxs_uncert(
+                    ak.to_numpy(df.HTXS.stage1_1_fine_cat_pTjet30GeV),
+                    self.stxs_lookups,
+                )
                 for i, name in enumerate(self.sths_names):
-                    wgt_up = stxs_uncert(
-                        i,
-                        ak.to_numpy(df.HTXS.stage1_1_fine_cat_pTjet30GeV),
-                        1.0,
-                        self.stxs_acc_lookups,
-                        self.powheg_xsec_lookup,
-                    )
-                    wgt_down = stxs_uncert(
-                        i,
-                        ak.to_numpy(df.HTXS.stage1_1_fine_cat_pTjet30GeV),
-                        -1.0,
-                        self.stxs_acc_lookups,
-                        self.powheg_xsec_lookup,
+                    weights.add_weight(
+                        "THU_VBF_" + name,
+                        {"up": thu_wgts[:, i, 0], "down": thu_wgts[:, i, 1]},
+                        how="only_vars",
                     )
-                    thu_wgts = {"up": wgt_up, "down": wgt_down}
-                    weights.add_weight("THU_VBF_" + name, thu_wgts, how="only_vars")
             else:
                 for i, name in enumerate(self.sths_names):
                     weights.add_weight("THU_VBF_" + name, how="dummy_vars")
@@ -850,6 +828,9 @@ class DimuonProcessor(processor.ProcessorABC):
         return output
 
     def prepare_lookups(self):
+        # Golden JSON (parsed only once)
+        self.lumi_mask = LumiMaskLookup(self.parameters["lumimask"])
+
         # Rochester correction
         rochester_data = txt_converters.convert_rochester_file(
             self.parameters["roccor_file"], loaduncs=True
@@ -857,7 +838,11 @@ class DimuonProcessor(processor.ProcessorABC):
         self.roccor_lookup = rochester_lookup.rochester_lookup(rochester_data)
 
         # JEC, JER and uncertainties
-        self.jec_factories, self.jec_factories_data = jec_factories(self.year)
+        self.jec_factories, self.jec_factories_data = jec_factories(
+            self.year,
+            unc_sources=self.parameters["jec_unc_to_consider"],
+            cache_path=self.parameters["jec_cache_path"],
+        )
 
         # Muon scale factors
         self.musf_lookup = musf_lookup(self.parameters)
@@ -869,8 +854,10 @@ class DimuonProcessor(processor.ProcessorABC):
             BTagScaleFactor.RESHAPE,
             "iterativefit,iterativefit,iterativefit",
         )
+        # NNLOPS reweighting
+        self.nnlops_lookups = nnlops_lookups(self.parameters)
         # STXS VBF cross-section uncertainty
-        self.stxs_acc_lookups, self.powheg_xsec_lookup = stxs_lookups()
+        self.stxs_lookups = stxs_lookups()
 
         # --- Evaluator
         self.extractor = extractor()
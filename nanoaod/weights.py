@@ -77,19 +77,3 @@ class Weights(object):
             return self.df[name].to_numpy()[mask]
         else:
             return np.array([])
-
-    def effect_on_normalization(self, mask=np.array([])):
-        if len(mask) == 0:
-            mask = np.ones(self.df.shape[0], dtype=int)
-        for var in self.variations:
-            if f"{var}_off" not in self.df.columns:
-                continue
-            wgt_off = self.df[f"{var}_off"].dropna().to_numpy().sum()
-            wgt_on = self.df["nominal"].dropna().to_numpy().sum()
-            effect = (wgt_on - wgt_off) / wgt_on * 100
-            if effect < 0:
-                ef = round(-effect, 2)
-                print(f"Enabling {var} decreases yield by {ef}%")
-            else:
-                ef = round(effect, 2)
-                print(f"Enabling {var} increases yield by {ef}%")
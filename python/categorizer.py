@@ -1,49 +1,173 @@
-def split_into_channels(df, v=None):
-    if v is None:
-        # this was used for Delphes datasets
-        cuts = {
-            "vbf": (df.jj_mass > 400) & (df.jj_dEta > 2.5) & (df.jet1_pt > 35),
-            "ggh_0jets": (df.njets == 0),
-            "ggh_1jet": (df.njets == 1)
-            & ((df.jj_mass <= 400) | (df.jj_dEta <= 2.5) | (df.jet1_pt < 35)),
-            "ggh_2orMoreJets": (df.njets >= 2)
-            & ((df.jj_mass <= 400) | (df.jj_dEta <= 2.5) | (df.jet1_pt < 35)),
-        }
-
-        for cname, cut in cuts.items():
-            df.loc[cut, "channel"] = cname
+from functools import reduce
+
+import numpy as np
+import pandas as pd
+import dask
+import dask.dataframe as dd
+
+# Channel codes are stored as int8 codes of a pandas Categorical,
+# so that comparisons with channel names still work downstream
+channel_names = ["none", "ttHorVH", "vbf", "ggh_0jets", "ggh_1jet", "ggh_2orMoreJets"]
+
+
+def categorize(df, parameters):
+    # Channels for all systematic variations are computed once per
+    # partition (lazily for Dask dataframes) and reused downstream
+    variations = parameters.get("syst_variations", ["nominal"])
+    if isinstance(df, dd.DataFrame):
+        meta = categorize_partition(df._meta, variations)
+        return df.map_partitions(categorize_partition, variations, meta=meta)
+    return categorize_partition(df, variations)
+
+
+def categorize_partition(df, variations=None):
+    if variations is None:
+        # this is used for Delphes datasets
+        suffixes = [""]
+        out_columns = ["channel"]
     else:
-        df[f"njets {v}"].fillna(0, inplace=True)
-        df.loc[:, f"channel {v}"] = "none"
-        df.loc[
-            (df[f"nBtagLoose {v}"] >= 2) | (df[f"nBtagMedium {v}"] >= 1), f"channel {v}"
-        ] = "ttHorVH"
-        df.loc[
-            (df[f"channel {v}"] == "none")
-            & (df[f"jj_mass {v}"] > 400)
-            & (df[f"jj_dEta {v}"] > 2.5)
-            & (df[f"jet1_pt {v}"] > 35),
-            f"channel {v}",
-        ] = "vbf"
-        df.loc[
-            (df[f"channel {v}"] == "none") & (df[f"njets {v}"] < 1), f"channel {v}"
-        ] = "ggh_0jets"
-        df.loc[
-            (df[f"channel {v}"] == "none") & (df[f"njets {v}"] == 1), f"channel {v}"
-        ] = "ggh_1jet"
-        df.loc[
-            (df[f"channel {v}"] == "none") & (df[f"njets {v}"] > 1), f"channel {v}"
-        ] = "ggh_2orMoreJets"
+        suffixes = [f" {v}" for v in variations]
+        out_columns = [f"channel {v}" for v in variations]
+
+    def column(name, fill=np.nan):
+        # (nevents, nvariations) array; falls back to the column
+        # without variation suffix if needed
+        cols = []
+        for suffix in suffixes:
+            if f"{name}{suffix}" in df.columns:
+                cols.append(df[f"{name}{suffix}"].to_numpy(dtype=float))
+            elif name in df.columns:
+                cols.append(df[name].to_numpy(dtype=float))
+            else:
+                cols.append(np.full(len(df), fill))
+        return np.nan_to_num(np.stack(cols, axis=1), nan=fill)
+
+    njets = column("njets", fill=0)
+    jj_mass = column("jj_mass")
+    jj_dEta = column("jj_dEta")
+    jet1_pt = column("jet1_pt")
+    nBtagLoose = column("nBtagLoose")
+    nBtagMedium = column("nBtagMedium")
+
+    with np.errstate(invalid="ignore"):
+        codes = np.select(
+            [
+                (nBtagLoose >= 2) | (nBtagMedium >= 1),
+                (jj_mass > 400) & (jj_dEta > 2.5) & (jet1_pt > 35),
+                njets < 1,
+                njets == 1,
+                njets > 1,
+            ],
+            [1, 2, 3, 4, 5],
+            default=0,
+        ).astype(np.int8)
+
+    df = df.copy(deep=False)
+    for i, col in enumerate(out_columns):
+        df[col] = pd.Categorical.from_codes(codes[:, i], categories=channel_names)
+    return df
+
+
+class QuantileSketch(object):
+    """
+    Mergeable weighted quantile sketch: values are compressed into
+    at most `size` weighted centroids of approximately equal weight.
+    Sketches built on separate partitions can be merged and queried
+    without collecting the full column.
+    """
+
+    def __init__(self, values=None, weights=None, size=1000):
+        self.size = size
+        if values is None:
+            values = []
+        values = np.asarray(values, dtype=np.float64)
+        if weights is None:
+            weights = np.ones(len(values))
+        weights = np.asarray(weights, dtype=np.float64)
+        valid = np.isfinite(values) & np.isfinite(weights)
+        self.means, self.weights = self.compress(values[valid], weights[valid])
+
+    def compress(self, values, weights):
+        if len(values) == 0:
+            return np.array([]), np.array([])
+        order = np.argsort(values, kind="stable")
+        values, weights = values[order], weights[order]
+        cumw = np.maximum.accumulate(np.cumsum(weights))
+        total = cumw[-1]
+        if (len(values) <= self.size) or (total <= 0):
+            return values, weights
+        group = np.minimum((cumw / total * self.size).astype(int), self.size - 1)
+        group = np.unique(group, return_inverse=True)[1]
+        sumw = np.bincount(group, weights=weights)
+        # centroid position is weighted by absolute weights,
+        # so that it stays within the group for negative weights
+        abs_w = np.bincount(group, weights=np.abs(weights))
+        means = np.bincount(group, weights=np.abs(weights) * values)
+        means = np.where(abs_w > 0, means / np.where(abs_w > 0, abs_w, 1), 0)
+        return means, sumw
+
+    def merge(self, other):
+        merged = QuantileSketch(size=self.size)
+        merged.means, merged.weights = self.compress(
+            np.concatenate([self.means, other.means]),
+            np.concatenate([self.weights, other.weights]),
+        )
+        return merged
+
+    def quantile(self, q):
+        if len(self.means) == 0:
+            return np.full(np.shape(q), np.nan)
+        # centroid weight is assigned to the middle of each centroid
+        cumw = np.maximum.accumulate(np.cumsum(self.weights))
+        mid = (cumw - 0.5 * self.weights) / cumw[-1]
+        return np.interp(q, np.maximum.accumulate(mid), self.means)
+
+
+def score_sketch(df, channel, score_name, weight_name=None, size=1000):
+    cut = df.channel == channel
+    weights = None if weight_name is None else df.loc[cut, weight_name]
+    return QuantileSketch(df.loc[cut, score_name], weights, size=size)
+
+
+def assign_score_categories(df, boundaries):
+    df = df.copy(deep=False)
+    if "category" not in df.columns:
+        df["category"] = None
+    for channel, (score_name, bnd) in boundaries.items():
+        cut = (df.channel == channel).to_numpy()
+        cat_names = np.array([f"{score_name}_cat{i}" for i in range(len(bnd) + 1)])
+        cat_idx = np.digitize(df.loc[cut, score_name].to_numpy(), bnd)
+        df.loc[cut, "category"] = cat_names[cat_idx]
+    return df
 
 
 def categorize_by_score(df, scores, mode="uniform", **kwargs):
+    # Categories in each channel are defined by weighted quantiles
+    # of the score. For Dask dataframes, the quantile sketches are
+    # built per partition and merged, so that the full column is
+    # never collected on a single worker.
     nbins = kwargs.pop("nbins", 4)
+    weight_name = kwargs.pop("weight", None)
+    size = kwargs.pop("sketch_size", 1000)
+    if mode != "uniform":
+        raise Exception(f"Error: unknown score categorization mode: {mode}")
+
+    quantiles = np.arange(1, nbins) / nbins
+    boundaries = {}
     for channel, score_name in scores.items():
-        score = df.loc[df.channel == channel, score_name]
-        if mode == "uniform":
-            for i in range(nbins):
-                cat_name = f"{score_name}_cat{i}"
-                cut_lo = score.quantile(i / nbins)
-                cut_hi = score.quantile((i + 1) / nbins)
-                cut = (df.channel == channel) & (score > cut_lo) & (score < cut_hi)
-                df.loc[cut, "category"] = cat_name
+        if isinstance(df, dd.DataFrame):
+            sketches = [
+                dask.delayed(score_sketch)(
+                    partition, channel, score_name, weight_name, size
+                )
+                for partition in df.to_delayed()
+            ]
+            sketch = dask.delayed(reduce)(lambda a, b: a.merge(b), sketches).compute()
+        else:
+            sketch = score_sketch(df, channel, score_name, weight_name, size)
+        boundaries[channel] = (score_name, sketch.quantile(quantiles))
+
+    if isinstance(df, dd.DataFrame):
+        meta = assign_score_categories(df._meta, boundaries)
+        return df.map_partitions(assign_score_categories, boundaries, meta=meta)
+    return assign_score_categories(df, boundaries)
@@ -1,5 +1,4 @@
 import itertools
-import numpy as np
 import pandas as pd
 from hist import Hist
 import dask.dataframe as dd
@@ -12,12 +11,11 @@ from python.io import (
     save_template,
     delete_existing_hists,
 )
-from python.categorizer import split_into_channels
+from python.categorizer import categorize_partition
 
 import warnings
 
 warnings.simplefilter(action="ignore", category=FutureWarning)
-from uproot3_methods.classes.TH1 import from_numpy
 
 
 def to_histograms(client, parameters, df):
@@ -49,7 +47,6 @@ def to_templates(client, parameters, hist_df=None):
 
     argset = {
         "year": parameters["years"],
-        "region": parameters["regions"],
         "channel": parameters["channels"],
         "var_name": [
             v for v in hist_df.var_name.unique() if v in parameters["plot_vars"]
@@ -100,10 +97,15 @@ def make_histograms(args, parameters={}):
     if "dy_m105_160_amc" in dataset:
         df = df[df.gjj_mass <= 350]
 
-    try:
-        split_into_channels(df, v="nominal")
-    except Exception:
-        split_into_channels(df)
+    # channels are normally assigned once per partition in load_dataframe
+    if parameters["has_variations"]:
+        missing = [
+            v for v in parameters["syst_variations"] if f"channel {v}" not in df.columns
+        ]
+        if missing:
+            df = categorize_partition(df, missing)
+    elif "channel" not in df.columns:
+        df = categorize_partition(df)
 
     wgt_variations = ["nominal"]
     syst_variations = ["nominal"]
@@ -121,15 +123,15 @@ def make_histograms(args, parameters={}):
     else:
         c_name = "channel"
 
-    regions = [r for r in regions if r in df.region.unique()]
-    channels = [c for c in channels if c in df[c_name].unique()]
-
-    # prepare multidimensional histogram
+    # Category axes are the same for all partitions, so that
+    # histograms of different partitions can be summed
     hist = (
-        Hist.new.StrCat(regions, name="region")
-        .StrCat(channels, name="channel")
+        Hist.new.StrCat(regions, name="region", growth=True)
+        .StrCat(channels, name="channel", growth=True)
         .StrCat(["value", "sumw2"], name="val_sumw2")
     )
+    regions = [r for r in regions if r in df.region.unique()]
+    channels = [c for c in channels if c in df[c_name].unique()]
 
     # axis for observable variable
     if ("score" in var.name) and ("mva_bins" in parameters.keys()):
@@ -140,7 +142,7 @@ def make_histograms(args, parameters={}):
 
     # axis for systematic variation
     if parameters["has_variations"]:
-        hist = hist.StrCat(variations, name="variation")
+        hist = hist.StrCat(variations, name="variation", growth=True)
 
     # container type
     hist = hist.Double()
@@ -208,8 +210,9 @@ def make_histograms(args, parameters={}):
 
 
 def make_templates(args, parameters={}):
+    # All (dataset, region, variation) templates for a given
+    # (year, variable, channel) are written into a single file
     year = args["year"]
-    region = args["region"]
     channel = args["channel"]
     var_name = args["var_name"]
     hist = args["hist_df"].loc[
@@ -225,27 +228,48 @@ def make_templates(args, parameters={}):
         return
 
     total_yield = 0
-    templates = []
+    templates = {}
     for dataset in hist.dataset.unique():
-        myhist = hist.loc[hist.dataset == dataset, "hist"].values[0]
-        the_hist = myhist[region, channel, "value", :].project(var.name).values()
-        the_sumw2 = myhist[region, channel, "sumw2", :].project(var.name).values()
-        edges = myhist[region, channel, "value", :].project(var.name).axes[0].edges
-        edges = np.array(edges)
-        centers = (edges[:-1] + edges[1:]) / 2.0
-        total_yield += the_hist.sum()
-
-        name = f"{dataset}_{region}_{channel}"
-        th1 = from_numpy([the_hist, edges])
-        th1._fName = name
-        th1._fSumw2 = np.array(np.append([0], the_sumw2))
-        th1._fTsumw2 = np.array(the_sumw2).sum()
-        th1._fTsumwx2 = np.array(the_sumw2 * centers).sum()
-        templates.append(th1)
+        # merge histograms saved for separate partitions
+        myhist = sum(hist.loc[hist.dataset == dataset, "hist"].values)
+        if channel not in myhist.axes["channel"]:
+            continue
+        # skip empty slices, as the category axes contain all regions and channels
+        filled = myhist[{"channel": channel, "val_sumw2": "sumw2"}]
+        regions = [
+            r
+            for r in parameters["regions"]
+            if (r in myhist.axes["region"]) and (filled[{"region": r}].sum() > 0)
+        ]
+        if "variation" in myhist.axes.name:
+            variations = list(myhist.axes["variation"])
+        else:
+            variations = [None]
+
+        for region in regions:
+            for variation in variations:
+                slicer = {"region": region, "channel": channel}
+                name = f"{dataset}_{region}_{channel}"
+                if variation is not None:
+                    slicer["variation"] = variation
+                    if variation != "nominal":
+                        name = f"{name}_{variation}"
+                the_hist = myhist[slicer]
+                values = the_hist["value", :].values()
+                sumw2 = the_hist["sumw2", :].values()
+                edges = the_hist.axes[var.name].edges
+
+                template = Hist.new.Var(edges, name=var.name).Weight()
+                template.view().value = values
+                template.view().variance = sumw2
+                templates[name] = template
+
+                if variation in [None, "nominal"]:
+                    total_yield += values.sum()
 
     if parameters["save_templates"]:
         path = parameters["templates_path"]
-        out_fn = f"{path}/{dataset}_{var.name}_{year}.root"
+        out_fn = f"{path}/{channel}_{var.name}_{year}.root"
         save_template(templates, out_fn, parameters)
 
     return total_yield
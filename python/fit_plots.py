@@ -1,4 +1,7 @@
 import ROOT as rt
+import numpy as np
+
+from python.math_tools import effective_sigma
 
 colors = [
     rt.kRed,
@@ -241,69 +244,19 @@ def plot(fitter, ds_name, models, blinded, category, label, title, save_path):
 
 
 def getEffSigma(_h):
-    nbins, binw, xmin = (
-        _h.GetXaxis().GetNbins(),
-        _h.GetXaxis().GetBinWidth(1),
-        _h.GetXaxis().GetXmin(),
-    )
-    mu, rms, total = _h.GetMean(), _h.GetRMS(), _h.Integral()
-    # Scan round window of mean: window RMS/binWidth (cannot be bigger than 0.1*number of bins)
-    nWindow = int(rms / binw) if (rms / binw) < 0.1 * nbins else int(0.1 * nbins)
-    # Determine minimum width of distribution which holds 0.693 of total
-    rlim = 0.683 * total
-    wmin = 9999999
-    # iscanmin = -999
-    for iscan in range(-1 * nWindow, nWindow + 1):
-        # Find bin idx in scan: iscan from mean
-        i_centre = int((mu - xmin) / binw + 1 + iscan)
-        x_centre = (i_centre - 0.5) * binw + xmin  # * 0.5 for bin centre
-        x_up, x_down = x_centre, x_centre
-        i_up, i_down = i_centre, i_centre
-        # Define counter for yield in bins: stop when counter > rlim
-        y = _h.GetBinContent(i_centre)  # Central bin height
-        r = y
-        reachedLimit = False
-        for j in range(1, nbins):
-            if reachedLimit:
-                continue
-            # Up:
-            if (i_up < nbins) & (not reachedLimit):
-                i_up += 1
-                x_up += binw
-                y = _h.GetBinContent(i_up)  # Current bin height
-                r += y
-                if r > rlim:
-                    reachedLimit = True
-            else:
-                print(
-                    " --> Reach nBins in effSigma calc: %s. Returning 0 for effSigma"
-                    % _h.GetName()
-                )
-                return 0
-            # Down:
-            if not reachedLimit:
-                if i_down > 0:
-                    i_down -= 1
-                    x_down -= binw
-                    y = _h.GetBinContent(i_down)  # Current bin height
-                    r += y
-                    if r > rlim:
-                        reachedLimit = True
-                else:
-                    print(
-                        " --> Reach 0 in effSigma calc: %s. Returning 0 for effSigma"
-                        % _h.GetName()
-                    )
-                    return 0
-        # Calculate fractional width in bin takes above limt (assume linear)
-        if y == 0.0:
-            dx = 0.0
-        else:
-            dx = (r - rlim) * (binw / y)
-        # Total width: half of peak
-        w = (x_up - x_down + binw - dx) * 0.5
-        if w < wmin:
-            wmin = w
-            # iscanmin = iscan
-        # Return effSigma
-        return wmin
+    # Accepts ROOT TH1 and 1D `hist` histograms
+    if isinstance(_h, rt.TH1):
+        nbins = _h.GetNbinsX()
+        contents = _h.GetArray()
+        contents.reshape((nbins + 2,))
+        values = np.array(contents, dtype=np.float64)[1:-1]
+        axis = _h.GetXaxis()
+        edges = np.linspace(axis.GetXmin(), axis.GetXmax(), nbins + 1)
+        if axis.GetXbins().GetSize() > 0:
+            xbins = axis.GetXbins()
+            xbins.GetArray().reshape((nbins + 1,))
+            edges = np.array(xbins.GetArray(), dtype=np.float64)
+    else:
+        values = _h.values()
+        edges = _h.axes[0].edges
+    return effective_sigma(values, edges)
@@ -1,7 +1,12 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 import ROOT as rt
+import numpy as np
 import pandas as pd
 
-from python.workflow import parallelize
 from python.io import mkdir
 from python.fit_plots import plot
 from python.fit_models import chebyshev, doubleCB, bwZ, bwGamma, bwZredux, bernstein
@@ -9,8 +14,20 @@ from python.fit_models import chebyshev, doubleCB, bwZ, bwGamma, bwZredux, berns
 rt.RooMsgService.instance().setGlobalKillBelow(rt.RooFit.ERROR)
 
 
-def run_fits(client, parameters, df):
-    signal_ds = parameters.pop("signals", [])
+fit_models = {
+    "bwz": bwZ,
+    "bwz_redux": bwZredux,
+    "bwgamma": bwGamma,
+    "bernstein": bernstein,
+    "dcb": doubleCB,
+    "chebyshev": chebyshev,
+}
+requires_order = ["chebyshev", "bernstein"]
+model_names = {"bkg": ["bwz", "bwz_redux", "bwgamma"], "sig": ["dcb"]}
+
+
+def run_fits(parameters, df):
+    signal_ds = parameters.get("signals", [])
     all_datasets = df.dataset.unique()
     signals = [ds for ds in all_datasets if ds in signal_ds]
     backgrounds = [ds for ds in all_datasets if ds not in signal_ds]
@@ -27,24 +44,52 @@ def run_fits(client, parameters, df):
         fit_setup = {"label": ds, "mode": "sig", "df": df[df.dataset == ds]}
         fit_setups.append(fit_setup)
 
-    argset = {
-        "fit_setup": fit_setups,
-        "channel": parameters["mva_channels"],
-        "category": df["category"].dropna().unique(),
-    }
-    fit_ret = parallelize(fitter, argset, client, parameters)
-    df_fits = pd.DataFrame(columns=["label", "channel", "category", "chi2"])
-    for fr in fit_ret:
-        df_fits = pd.concat([df_fits, pd.DataFrame.from_dict(fr)])
+    # Only mass and weight arrays are shipped to the workers,
+    # and each model is fitted in a separate task
+    tasks = []
+    for fit_setup in fit_setups:
+        df_setup = fit_setup["df"]
+        for channel in parameters["mva_channels"]:
+            for category in df["category"].dropna().unique():
+                df_fit = df_setup[
+                    (df_setup.channel == channel) & (df_setup.category == category)
+                ]
+                data = {
+                    "mass": df_fit["dimuon_mass"].to_numpy(dtype=float),
+                    "weight": df_fit["lumi_wgt"].to_numpy(dtype=float),
+                }
+                for model_name in model_names[fit_setup["mode"]]:
+                    tasks.append(
+                        {
+                            "label": fit_setup["label"],
+                            "mode": fit_setup["mode"],
+                            "blinded": fit_setup.get("blinded", False),
+                            "channel": channel,
+                            "category": category,
+                            "model_name": model_name,
+                            "data": data,
+                        }
+                    )
+
+    # ROOT is not thread-safe, so the fits are run in separate processes.
+    # Processes are spawned rather than forked, so that workers
+    # do not inherit the ROOT state of the parent process.
+    nworkers = parameters.get("fit_nworkers", os.cpu_count())
+    with ProcessPoolExecutor(
+        max_workers=nworkers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        fit_ret = list(pool.map(partial(fitter, parameters=parameters), tasks))
+
+    df_fits = pd.DataFrame(fit_ret)
     # choose fit function with lowest chi2/dof
     df_fits.loc[df_fits.chi2 <= 0, "chi2"] = 999.0
     df_fits.to_pickle("all_chi2.pkl")
     idx = df_fits.groupby(["label", "channel", "category"])["chi2"].idxmin()
     df_fits = (
         df_fits.loc[idx]
-        .reset_index()
         .set_index(["label", "channel"])
         .sort_index()
+        .drop(columns=["params"])
         .drop_duplicates()
     )
     print(df_fits)
@@ -53,43 +98,38 @@ def run_fits(client, parameters, df):
 
 
 def fitter(args, parameters={}):
-    fit_setup = args["fit_setup"]
-    df = fit_setup["df"]
-    label = fit_setup["label"]
-    mode = fit_setup["mode"]
-    blinded = fit_setup.pop("blinded", False)
-    save = parameters.pop("save_fits", False)
-    save_path = parameters.get("save_fits_path", "fits/")
+    label = args["label"]
+    mode = args["mode"]
+    blinded = args["blinded"]
     channel = args["channel"]
     category = args["category"]
+    model_name = args["model_name"]
+    mass = args["data"]["mass"]
+    norm = args["data"]["weight"].sum()
 
+    save = parameters.get("save_fits", False)
+    save_path = parameters.get("save_fits_path", "fits/")
     save_path = save_path + f"/fits_{channel}_{category}/"
-    mkdir(save_path)
-
-    df = df[(df.channel == args["channel"]) & (df.category == args["category"])]
-    norm = df.lumi_wgt.sum()
+    if save:
+        mkdir(save_path)
 
     the_fitter = Fitter(
         fitranges={"low": 110, "high": 150, "SR_left": 120, "SR_right": 130},
-        fitmodels={
-            "bwz": bwZ,
-            "bwz_redux": bwZredux,
-            "bwgamma": bwGamma,
-            "bernstein": bernstein,
-            "dcb": doubleCB,
-            "chebyshev": chebyshev,
-        },
-        requires_order=["chebyshev", "bernstein"],
+        fitmodels=fit_models,
+        requires_order=requires_order,
         channel=channel,
-        filename_ext="",
+        # each model is fitted in a separate process,
+        # so workspaces and plots are saved per model
+        filename_ext=f"_{model_name}",
+        binned=parameters.get("fit_binned", True),
     )
     if mode == "bkg":
         chi2 = the_fitter.simple_fit(
-            dataset=df,
+            dataset=mass,
             label=label,
             category=category,
             blinded=blinded,
-            model_names=["bwz", "bwz_redux", "bwgamma"],
+            model_names=[model_name],
             fix_parameters=False,
             title="Background",
             save=save,
@@ -101,7 +141,7 @@ def fitter(args, parameters={}):
             label="pseudodata_" + label,
             category=category,
             blinded=blinded,
-            model_names=["bwz", "bwz_redux", "bwgamma"],
+            model_names=[model_name],
             fix_parameters=False,
             title="Pseudo-data",
             save=save,
@@ -111,18 +151,27 @@ def fitter(args, parameters={}):
 
     if mode == "sig":
         chi2 = the_fitter.simple_fit(
-            dataset=df,
+            dataset=mass,
             label=label,
             category=category,  # temporary
             blinded=False,
-            model_names=["dcb"],
+            model_names=[model_name],
             fix_parameters=True,
             title="Signal",
             save=save,
             save_path=save_path,
             norm=norm,
         )
-    ret = {"label": label, "channel": channel, "category": category, "chi2": chi2}
+
+    model_key = list(chi2.keys())[0]
+    ret = {
+        "label": label,
+        "channel": channel,
+        "category": category,
+        "model": model_key,
+        "chi2": chi2[model_key],
+        "params": the_fitter.fit_params[f"ds_{label}"][model_key],
+    }
     return ret
 
 
@@ -135,9 +184,13 @@ class Fitter(object):
         self.requires_order = kwargs.pop("requires_order", [])
         self.channel = kwargs.pop("channel", "ggh_0jets")
         self.filename_ext = kwargs.pop("filename_ext", "")
+        # binned likelihood fits by default, unbinned fits are optional
+        self.binned = kwargs.pop("binned", True)
+        self.nbins = kwargs.pop("nbins", 800)
 
         self.data_registry = {}
         self.model_registry = []
+        self.fit_params = {}
 
         self.workspace = self.create_workspace()
 
@@ -162,7 +215,7 @@ class Fitter(object):
 
         ds_name = f"ds_{label}"
         self.add_data(dataset, ds_name=ds_name, blinded=blinded)
-        ndata = len(dataset["dimuon_mass"].values)
+        ndata = len(dataset)
 
         for model_name in model_names:
             if (model_name in self.requires_order) and (model_name in orders.keys()):
@@ -224,13 +277,19 @@ class Fitter(object):
             )
 
         if isinstance(data, pd.DataFrame):
-            data = self.fill_dataset(
-                data["dimuon_mass"].values, self.workspace.obj("mass"), ds_name=ds_name
-            )
+            data = data["dimuon_mass"].values
         elif isinstance(data, pd.Series):
-            data = self.fill_dataset(
-                data.values, self.workspace.obj("mass"), ds_name=ds_name
-            )
+            data = data.values
+
+        if isinstance(data, np.ndarray):
+            if self.binned:
+                data = self.fill_datahist(
+                    data, self.workspace.obj("mass"), ds_name=ds_name
+                )
+            else:
+                data = self.fill_dataset(
+                    data, self.workspace.obj("mass"), ds_name=ds_name
+                )
         elif not (
             isinstance(data, rt.TH1F)
             or isinstance(data, rt.RooDataSet)
@@ -276,9 +335,14 @@ class Fitter(object):
                 model_key = model_name + tag
             # print(model_key)
             # self.workspace.pdf(model_key).Print()
-            data = self.workspace.pdf(model_key).generate(
-                rt.RooArgSet(self.workspace.obj("mass")), norm
-            )
+            if self.binned:
+                data = self.workspace.pdf(model_key).generateBinned(
+                    rt.RooArgSet(self.workspace.obj("mass")), norm
+                )
+            else:
+                data = self.workspace.pdf(model_key).generate(
+                    rt.RooArgSet(self.workspace.obj("mass")), norm
+                )
             ds_name = f"pseudodata_{model_key}"
             self.add_data(data, ds_name=ds_name)
             chi2[model_key] = self.fit(
@@ -311,6 +375,33 @@ class Fitter(object):
                 ds.add(cols)
         return ds
 
+    def fill_datahist(self, data, x, ds_name="ds"):
+        # Histogram the data with NumPy and import the bin contents
+        # into a RooDataHist, avoiding per-event loops in Python
+        edges = np.linspace(x.getMin(), x.getMax(), self.nbins + 1)
+        counts, _ = np.histogram(data, bins=edges)
+        return self.make_datahist(counts, counts, x, ds_name=ds_name)
+
+    def make_datahist(self, sumw, sumw2, x, ds_name="ds"):
+        # Import bin contents (without under/overflow) into a RooDataHist.
+        # The RooDataHist takes the binning of the histogram, the default
+        # binning of the shared mass variable is not changed.
+        nbins = len(sumw)
+        edges = np.linspace(x.getMin(), x.getMax(), nbins + 1)
+
+        # include empty underflow and overflow bins
+        sumw = np.concatenate([[0], sumw, [0]]).astype(np.float64)
+        sumw2 = np.concatenate([[0], sumw2, [0]]).astype(np.float64)
+
+        hist = rt.TH1D(f"h_{ds_name}", f"h_{ds_name}", nbins, edges)
+        hist.SetDirectory(0)
+        hist.Sumw2()
+        hist.SetContent(sumw)
+        hist.SetError(np.sqrt(sumw2))
+        return rt.RooDataHist(
+            ds_name, ds_name, rt.RooArgList(x), rt.RooFit.Import(hist)
+        )
+
     def generate_data(self, model_name, category, xSec, lumi):
         tag = f"_{self.channel}_{category}"
         model_key = model_name + tag
@@ -378,6 +469,10 @@ class Fitter(object):
                 rt.RooFit.PrintLevel(-1),
                 rt.RooFit.Verbose(rt.kFALSE),
             )
+            params = pdfs[model_key].getParameters(self.workspace.obj(ds_name))
+            self.fit_params.setdefault(ds_name, {})[model_key] = {
+                p.GetName(): p.getVal() for p in params
+            }
             if fix_parameters:
                 pdfs[model_key].getParameters(rt.RooArgSet()).setAttribAll("Constant")
             chi2[model_key] = self.get_chi2(model_key, ds_name, ndata)
@@ -0,0 +1,122 @@
+import os
+import pickle
+from functools import lru_cache
+
+import numpy as np
+
+# Trained models are exported to formats that can be evaluated without
+# TensorFlow and independently of the xgboost version used for training:
+# DNNs (Keras .h5) to ONNX, BDTs (pickled XGBClassifier) to XGBoost JSON.
+
+
+def export_dnn(model_path, out_path=None):
+    import tensorflow as tf
+    import tf2onnx
+    from tensorflow.keras.models import load_model
+
+    if out_path is None:
+        out_path = os.path.splitext(model_path)[0] + ".onnx"
+    model = load_model(model_path)
+    input_signature = [
+        tf.TensorSpec(shape=(None,) + tuple(model.input_shape[1:]), dtype=tf.float32)
+    ]
+    tf2onnx.convert.from_keras(
+        model, input_signature=input_signature, output_path=out_path
+    )
+    return out_path
+
+
+def export_bdt(model_path, out_path=None):
+    if out_path is None:
+        out_path = os.path.splitext(model_path)[0] + ".json"
+    with open(model_path, "rb") as f:
+        model = pickle.load(f)
+    model.get_booster().save_model(out_path)
+    return out_path
+
+
+def export_model(model_path):
+    # Returns the path to the exported model
+    if model_path.endswith(".h5"):
+        return export_dnn(model_path)
+    elif model_path.endswith(".pkl"):
+        return export_bdt(model_path)
+    # already in a portable format
+    return model_path
+
+
+def export_model_dir(path):
+    # Export all models saved in a directory, e.g. {models_path}/{model}
+    exported = []
+    for file_name in sorted(os.listdir(path)):
+        if file_name.endswith(".h5") or file_name.endswith(".pkl"):
+            exported.append(export_model(f"{path}/{file_name}"))
+    return exported
+
+
+class OnnxModel(object):
+    """DNN evaluated with ONNX Runtime, single-threaded like a Dask worker"""
+
+    def __init__(self, path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = 1
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            path, sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self.input_name = self.session.get_inputs()[0].name
+
+    def predict(self, x):
+        # Same output structure as keras Model.predict
+        outputs = self.session.run(
+            None, {self.input_name: np.asarray(x, dtype=np.float32)}
+        )
+        return outputs[0] if len(outputs) == 1 else outputs
+
+
+class BoosterModel(object):
+    """BDT evaluated from an XGBoost JSON model"""
+
+    def __init__(self, path):
+        import xgboost as xgb
+
+        self.xgb = xgb
+        self.booster = xgb.Booster()
+        self.booster.load_model(path)
+        self.booster.set_param({"nthread": 1})
+
+    def predict_proba(self, x):
+        # Same output structure as XGBClassifier.predict_proba
+        prediction = self.booster.predict(self.xgb.DMatrix(np.asarray(x)))
+        if prediction.ndim == 1:
+            prediction = np.stack([1 - prediction, prediction], axis=1)
+        return prediction
+
+
+@lru_cache(maxsize=None)
+def load_dnn(path):
+    """
+    `path` without extension. Uses the ONNX export if it exists,
+    otherwise falls back to the Keras model (requires TensorFlow).
+    Models are loaded once per process.
+    """
+    if os.path.exists(path + ".onnx"):
+        return OnnxModel(path + ".onnx")
+    from tensorflow.keras.models import load_model
+
+    return load_model(path + ".h5")
+
+
+@lru_cache(maxsize=None)
+def load_bdt(path):
+    """
+    `path` without extension. Uses the XGBoost JSON export if it exists,
+    otherwise falls back to the pickled model, which requires the same
+    xgboost version as in training.
+    """
+    if os.path.exists(path + ".json"):
+        return BoosterModel(path + ".json")
+    with open(path + ".pkl", "rb") as f:
+        return pickle.load(f)
@@ -3,6 +3,7 @@ import pandas as pd
 import dask.dataframe as dd
 import pickle
 import glob
+import itertools
 
 
 def mkdir(path):
@@ -127,11 +128,52 @@ def load_histogram(argset, parameters):
     return hist_df
 
 
+def merge_histograms(hists):
+    """
+    Sum of histograms saved for separate partitions. Histograms with
+    different categories (e.g. saved with non-growing category axes)
+    are merged into a histogram with the union of the categories.
+    """
+    import hist as hist_lib
+
+    hists = list(hists)
+    try:
+        return sum(hists[1:], hists[0].copy())
+    except ValueError:
+        pass
+
+    first = hists[0]
+    cat_names = [
+        ax.name for ax in first.axes if isinstance(ax, hist_lib.axis.StrCategory)
+    ]
+    axes = []
+    for ax in first.axes:
+        if ax.name not in cat_names:
+            axes.append(ax)
+            continue
+        categories = []
+        for h in hists:
+            categories += [c for c in h.axes[ax.name] if c not in categories]
+        axes.append(hist_lib.axis.StrCategory(categories, name=ax.name, growth=True))
+    merged = hist_lib.Hist(*axes, storage=first.storage_type())
+    view = merged.view(flow=True)
+    for h in hists:
+        for cats in itertools.product(*[list(h.axes[n]) for n in cat_names]):
+            slicer = dict(zip(cat_names, cats))
+            index = tuple(
+                merged.axes[ax.name].index(slicer[ax.name])
+                if ax.name in slicer
+                else slice(None)
+                for ax in merged.axes
+            )
+            view[index] += h[slicer].view(flow=True)
+    return merged
+
+
 def save_template(templates, out_name, parameters):
-    import uproot3
+    import uproot
 
-    out_file = uproot3.recreate(out_name)
-    for tmp in templates:
-        out_file[tmp._fName] = tmp
-    out_file.close()
+    # all templates are written in bulk into a single file
+    with uproot.recreate(out_name) as out_file:
+        out_file.update(templates)
     return
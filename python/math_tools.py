@@ -228,3 +228,32 @@ def delta_r(eta1, eta2, phi1, phi2):
 
 def max_abs_eta(row):
     return max(abs(row["mu1_eta"]), abs(row["mu2_eta"]))
+
+
+def effective_sigma(values, edges, fraction=0.683):
+    # Half-width of the narrowest interval containing `fraction`
+    # of the integral. For each starting edge, the first end edge
+    # reaching the target is found with a single sorted sweep over
+    # the cumulative sum; the excess in the last bin is removed
+    # assuming a flat distribution within the bin.
+    values = np.clip(np.asarray(values, dtype=np.float64), 0, None)
+    edges = np.asarray(edges, dtype=np.float64)
+    cumsum = np.concatenate([[0.0], np.cumsum(values)])
+    target = fraction * cumsum[-1]
+    if target <= 0:
+        return 0.0
+
+    start = np.arange(len(values))
+    end = np.searchsorted(cumsum, cumsum[:-1] + target, side="left")
+    valid = end <= len(values)
+    start, end = start[valid], end[valid]
+
+    excess = cumsum[end] - cumsum[start] - target
+    last_bin = end - 1
+    dx = np.where(
+        values[last_bin] > 0,
+        excess / np.where(values[last_bin] > 0, values[last_bin], 1.0),
+        0.0,
+    ) * (edges[last_bin + 1] - edges[last_bin])
+    width = edges[end] - edges[start] - dx
+    return 0.5 * width.min()
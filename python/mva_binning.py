@@ -0,0 +1,175 @@
+import numpy as np
+
+
+def weighted_quantiles(values, weights, quantiles):
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    order = np.argsort(values)
+    cumw = np.cumsum(weights[order])
+    cumw = np.maximum.accumulate(cumw) / cumw[-1]
+    return np.interp(quantiles, cumw, values[order])
+
+
+def bins_from_target_yields(score, weight, target_yields, xmin=0, xmax=5.0):
+    """
+    Place bin boundaries such that each bin contains the target yield.
+    `target_yields` are given in bin order (increasing score); the bins
+    are filled starting from the highest score.
+    """
+    score = np.asarray(score, dtype=np.float64)
+    weight = np.asarray(weight, dtype=np.float64)
+    order = np.argsort(-score, kind="stable")
+    score = score[order]
+    cumsum = np.cumsum(weight[order])
+
+    boundaries = []
+    start = 0
+    base = 0.0
+    for target in target_yields[::-1]:
+        if start >= len(cumsum):
+            break
+        # first event where the accumulated yield reaches the target;
+        # running maximum keeps the search valid with negative weights
+        running_max = np.maximum.accumulate(cumsum[start:])
+        idx = np.searchsorted(running_max, base + target, side="left")
+        if idx >= len(running_max):
+            break
+        idx += start
+        boundaries.append(round(score[idx], 3))
+        base = cumsum[idx]
+        start = idx + 1
+    return sorted([xmin, xmax] + boundaries)
+
+
+def asimov_significance2(s, b):
+    # Asimov significance squared, used both to optimize and to evaluate bins
+    s = np.asarray(s, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z2 = 2 * ((s + b) * np.log1p(s / b) - s)
+    return np.where((b > 0) & (s > 0), z2, 0.0)
+
+
+def bins_max_significance(
+    sig_score,
+    sig_weight,
+    bkg_score,
+    bkg_weight,
+    nbins=13,
+    ncandidates=100,
+    min_bkg=1.0,
+    xmin=0,
+    xmax=5.0,
+):
+    """
+    Choose `nbins` bins maximizing the combined Asimov significance.
+    Candidate boundaries are weighted quantiles of the signal score,
+    and the optimal combination of candidates is found by dynamic
+    programming over cumulative signal and background yields.
+    """
+    quantiles = np.linspace(0, 1, ncandidates + 1)[1:-1]
+    candidates = np.unique(
+        np.round(weighted_quantiles(sig_score, sig_weight, quantiles), 3)
+    )
+    candidates = candidates[(candidates > xmin) & (candidates < xmax)]
+    edges = np.concatenate([[xmin], candidates, [xmax]])
+
+    s, _ = np.histogram(sig_score, bins=edges, weights=sig_weight)
+    b, _ = np.histogram(bkg_score, bins=edges, weights=bkg_weight)
+    cum_s = np.concatenate([[0.0], np.cumsum(s)])
+    cum_b = np.concatenate([[0.0], np.cumsum(b)])
+
+    # z2[i, k]: significance^2 of a single bin spanning edges[i] to edges[k]
+    s_ik = cum_s[np.newaxis, :] - cum_s[:, np.newaxis]
+    b_ik = cum_b[np.newaxis, :] - cum_b[:, np.newaxis]
+    z2 = asimov_significance2(s_ik, b_ik)
+    npoints = len(edges)
+    allowed = np.triu(np.ones((npoints, npoints), dtype=bool), k=1)
+    z2 = np.where(allowed & (b_ik >= min_bkg), z2, -np.inf)
+
+    # best[j, k]: best total significance^2 of j+1 bins from edges[0] to edges[k]
+    nbins = min(nbins, npoints - 1)
+    best = np.full((nbins, npoints), -np.inf)
+    prev = np.zeros((nbins, npoints), dtype=int)
+    best[0] = z2[0]
+    for j in range(1, nbins):
+        total = best[j - 1][:, np.newaxis] + z2
+        prev[j] = np.argmax(total, axis=0)
+        best[j] = total[prev[j], np.arange(npoints)]
+
+    # number of bins (up to nbins) with the highest total significance
+    nbins_ok = np.flatnonzero(np.isfinite(best[:, -1]))
+    if len(nbins_ok) == 0:
+        return [xmin, xmax]
+    j = nbins_ok[np.argmax(best[nbins_ok, -1])]
+    boundaries = [npoints - 1]
+    k = npoints - 1
+    while j > 0:
+        k = prev[j, k]
+        boundaries.append(k)
+        j -= 1
+    boundaries.append(0)
+    edges = [xmin] + [float(e) for e in edges[1:-1]] + [xmax]
+    return [edges[k] for k in sorted(set(boundaries))]
+
+
+def optimize_mva_bins(df, model, years, target_yields=None, signals=None, **kwargs):
+    """
+    Returns {year: bins} for a given model, in the format of
+    nanoaod/config/mva_bins.py. If target yields are provided, the
+    boundaries reproduce them for the signal samples; otherwise the
+    Asimov significance is maximized.
+    """
+    if signals is None:
+        signals = ["vbf_powheg_dipole"]
+    var = f"score_{model}"
+    df = df[(df.r == "h-peak") & (df.c == "vbf") & (df.v == "nominal")]
+    bins = {}
+    for year in years:
+        df_year = df[df.year == int(year)]
+        sig = df_year[df_year.s.isin(signals)]
+        if target_yields is not None:
+            bins[year] = bins_from_target_yields(
+                sig[var], sig["wgt_nominal"], target_yields[year], **kwargs
+            )
+        else:
+            bkg = df_year[df_year.cls == "background"]
+            bins[year] = bins_max_significance(
+                sig[var],
+                sig["wgt_nominal"],
+                bkg[var],
+                bkg["wgt_nominal"],
+                **kwargs,
+            )
+    return bins
+
+
+def format_mva_bins(mva_bins, indent=0):
+    # Same layout as nanoaod/config/mva_bins.py
+    pad = " " * 4 * (indent + 1)
+    if isinstance(mva_bins, dict):
+        lines = [
+            f'{pad}"{k}": {format_mva_bins(v, indent + 1)},'
+            for k, v in mva_bins.items()
+        ]
+        return "{\n" + "\n".join(lines) + "\n" + " " * 4 * indent + "}"
+    lines = [
+        f"{pad}{v if isinstance(v, int) else round(float(v), 3)}," for v in mva_bins
+    ]
+    return "[\n" + "\n".join(lines) + "\n" + " " * 4 * indent + "]"
+
+
+def save_mva_bins(new_bins, path="nanoaod/config/mva_bins.py"):
+    # Update existing entries and add new models
+    namespace = {}
+    try:
+        with open(path) as f:
+            exec(f.read(), namespace)
+    except FileNotFoundError:
+        pass
+    mva_bins = namespace.get("mva_bins", {})
+    for model, bins in new_bins.items():
+        mva_bins.setdefault(model, {}).update(bins)
+    with open(path, "w") as f:
+        f.write(f"mva_bins = {format_mva_bins(mva_bins)}\n")
+    return mva_bins
@@ -0,0 +1,143 @@
+import re
+
+import numpy as np
+import pyarrow.parquet as pq
+import xgboost as xgb
+
+from python.scalers import normalize
+
+
+class ParquetFeed(object):
+    """
+    Streams training data from stage1 Parquet files in batches.
+    Only the needed columns are read, and events are selected by dataset,
+    by an optional cut, and by cross-validation folds (event number mod
+    nfolds), so the full training set never has to be held in memory.
+    """
+
+    def __init__(self, paths, features, class_map, **kwargs):
+        self.paths = paths
+        self.features = features
+        # {dataset: numerical class}
+        self.class_map = class_map
+        self.folds = kwargs.pop("folds", None)
+        self.nfolds = kwargs.pop("nfolds", 4)
+        self.cut = kwargs.pop("cut", None)
+        # column values required for selected events; the columns are
+        # read from the files or added by `transform`
+        self.selection = kwargs.pop("selection", {})
+        # function adding derived features to each batch, and its inputs
+        self.transform = kwargs.pop("transform", None)
+        self.extra_columns = kwargs.pop("extra_columns", [])
+        self.batch_size = kwargs.pop("batch_size", 100000)
+        self.scalers = None
+
+    def columns(self, available):
+        needed = set(self.features + ["dataset", "event"])
+        needed |= set(self.selection.keys()) | set(self.extra_columns)
+        if self.cut is not None:
+            needed |= {
+                c for c in available if re.search(rf"\b{re.escape(c)}\b", self.cut)
+            }
+        return [c for c in available if c in needed]
+
+    def batches(self, columns=[]):
+        # Selected events as pandas DataFrames
+        for path in self.paths:
+            parquet_file = pq.ParquetFile(path)
+            available = parquet_file.schema_arrow.names
+            read_columns = self.columns(available)
+            read_columns += [
+                c for c in columns if c in available and c not in read_columns
+            ]
+            for batch in parquet_file.iter_batches(
+                batch_size=self.batch_size, columns=read_columns
+            ):
+                df = batch.to_pandas()
+                selected = df.dataset.isin(self.class_map.keys()).values
+                if self.folds is not None:
+                    event = df.event.values.astype(np.int64)
+                    selected = selected & np.isin(event % self.nfolds, self.folds)
+                df = df[selected]
+                if df.shape[0] == 0:
+                    continue
+                if self.transform is not None:
+                    df = self.transform(df)
+                for column, value in self.selection.items():
+                    if column not in df.columns:
+                        raise Exception(
+                            f"Error: selection column {column} not found in {path}"
+                        )
+                    df = df[df[column] == value]
+                if self.cut is not None:
+                    df = df.query(self.cut)
+                if df.shape[0] == 0:
+                    continue
+                yield df
+
+    def arrays(self, labels="class"):
+        """
+        Yields (x, y) with features as float32 arrays, normalized if scalers
+        are set. `labels` is a column name, or a dict {output: column} for
+        models with several outputs; "class" is the numerical class.
+        """
+        label_columns = [labels] if isinstance(labels, str) else list(labels.values())
+        for df in self.batches(columns=label_columns):
+            x = df[self.features].to_numpy(dtype=np.float32, copy=True)
+            if self.scalers is not None:
+                x = normalize(x, self.scalers)
+            if isinstance(labels, str):
+                y = self.label(df, labels)
+            else:
+                y = {name: self.label(df, column) for name, column in labels.items()}
+            yield x, y
+
+    def label(self, df, column):
+        if column == "class":
+            return df.dataset.map(self.class_map).to_numpy(dtype=np.float32)
+        return df[column].to_numpy(dtype=np.float32)
+
+    def set_scalers(self, scalers):
+        # [mean, std], applied in place to float32 batches
+        self.scalers = np.asarray(scalers, dtype=np.float32)
+
+    def tf_dataset(self, labels="class", batch_size=1024, shuffle_buffer=100000):
+        import tensorflow as tf
+
+        nfeatures = len(self.features)
+        x_spec = tf.TensorSpec(shape=(None, nfeatures), dtype=tf.float32)
+        y_spec = tf.TensorSpec(shape=(None,), dtype=tf.float32)
+        if not isinstance(labels, str):
+            y_spec = {name: y_spec for name in labels.keys()}
+
+        dataset = tf.data.Dataset.from_generator(
+            lambda: self.arrays(labels=labels), output_signature=(x_spec, y_spec)
+        )
+        dataset = dataset.unbatch()
+        if shuffle_buffer:
+            dataset = dataset.shuffle(shuffle_buffer)
+        return dataset.batch(batch_size).prefetch(tf.data.experimental.AUTOTUNE)
+
+    def dmatrix(self, cache_prefix):
+        # External-memory DMatrix, filled batch by batch
+        return xgb.DMatrix(DMatrixIterator(self, cache_prefix))
+
+
+class DMatrixIterator(xgb.DataIter):
+    def __init__(self, feed, cache_prefix):
+        self.feed = feed
+        self._arrays = None
+        super().__init__(cache_prefix=cache_prefix)
+
+    def next(self, input_data):
+        if self._arrays is None:
+            self._arrays = self.feed.arrays()
+        try:
+            x, y = next(self._arrays)
+        except StopIteration:
+            return 0
+        input_data(data=x, label=y)
+        return 1
+
+    def reset(self):
+        self._arrays = None
@@ -0,0 +1,101 @@
+import numpy as np
+import dask
+import dask.dataframe as dd
+import hist
+
+# Classifier diagnostics computed from finely binned weighted histograms.
+# Histograms filled on different partitions are merged by summing them,
+# so the full unbinned score columns are never needed at once.
+
+
+def max_abs_eta(df):
+    return np.maximum(np.abs(df["mu1_eta"]), np.abs(df["mu2_eta"]))
+
+
+def get_column(df, name):
+    if (name == "max_abs_eta") and (name not in df.columns):
+        return max_abs_eta(df)
+    return df[name]
+
+
+def make_histogram(
+    df,
+    var,
+    weight="lumi_wgt",
+    bins=1000,
+    var_range=(0, 1),
+    shape_of=None,
+    shape_bins=80,
+    shape_range=(115, 135),
+):
+    """
+    Weighted histogram of `var` (e.g. a classifier score), optionally
+    together with another variable whose shape is studied in bins of `var`.
+    Dask DataFrames are filled per partition and the results are summed.
+    """
+    if isinstance(df, dd.DataFrame):
+        args = (var, weight, bins, var_range, shape_of, shape_bins, shape_range)
+        partials = [dask.delayed(make_histogram)(p, *args) for p in df.to_delayed()]
+        return dask.delayed(sum)(partials).compute()
+
+    hist_ = hist.Hist.new.Reg(bins, *var_range, name=var)
+    values = {var: get_column(df, var).values}
+    if shape_of is not None:
+        hist_ = hist_.Reg(shape_bins, *shape_range, name=shape_of)
+        values[shape_of] = get_column(df, shape_of).values
+    hist_ = hist_.Weight()
+    hist_.fill(**values, weight=df[weight].values)
+    return hist_
+
+
+def class_histograms(df, var, class_column="class", **kwargs):
+    # {class: histogram} for all classes present in the dataframe
+    classes = df[class_column].dropna().unique()
+    if isinstance(df, dd.DataFrame):
+        classes = classes.compute()
+    return {
+        cls: make_histogram(df[df[class_column] == cls], var, **kwargs)
+        for cls in classes
+    }
+
+
+def roc_curve(sig_hist, bkg_hist):
+    """
+    False and true positive rates for cuts on the bin edges of
+    one-dimensional histograms with identical binning, from the highest
+    threshold to the lowest, as in sklearn.metrics.roc_curve.
+    """
+    sig = sig_hist.values(flow=True)[::-1]
+    bkg = bkg_hist.values(flow=True)[::-1]
+    tpr = np.concatenate([[0], np.cumsum(sig)]) / sig.sum()
+    fpr = np.concatenate([[0], np.cumsum(bkg)]) / bkg.sum()
+    edges = sig_hist.axes[0].edges
+    thresholds = np.concatenate([[np.inf], edges[::-1], [-np.inf]])
+    return fpr, tpr, thresholds
+
+
+def auc(fpr, tpr):
+    return np.sum(np.diff(fpr) * (tpr[1:] + tpr[:-1]) / 2)
+
+
+def shapes_in_bins(hist_2d, nbins=4, density=True):
+    """
+    Shapes of the second variable of a 2D histogram in bins of the first
+    variable, chosen such that each bin contains the same weighted yield.
+    Returns a list of (low edge, high edge, values, edges).
+    """
+    values = hist_2d.values()
+    edges = hist_2d.axes[0].edges
+    shape_edges = hist_2d.axes[1].edges
+    cumsum = np.cumsum(values.sum(axis=1))
+    bounds = np.searchsorted(cumsum / cumsum[-1], np.arange(1, nbins) / nbins)
+    bounds = np.minimum(bounds + 1, len(edges) - 1)
+    bounds = np.concatenate([[0], bounds, [len(edges) - 1]])
+
+    shapes = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        shape = values[lo:hi].sum(axis=0)
+        if density and shape.sum() != 0:
+            shape = shape / shape.sum() / np.diff(shape_edges)
+        shapes.append((edges[lo], edges[hi], shape, shape_edges))
+    return shapes
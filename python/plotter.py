@@ -1,12 +1,23 @@
+import os
+import json
+import hashlib
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
 import pandas as pd
 import numpy as np
 from hist.intervals import poisson_interval
 from python.workflow import parallelize
-from python.io import load_histogram
+from python.io import load_histogram, merge_histograms
 from python.variable import Variable
 
-import matplotlib.pyplot as plt
-import mplhep as hep
+import matplotlib
+
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt  # noqa: E402
+import mplhep as hep  # noqa: E402
 
 style = hep.style.CMS
 style["mathtext.fontset"] = "cm"
@@ -71,34 +82,77 @@ def plotter(client, parameters, hist_df=None, timer=None):
         hist_dfs = parallelize(load_histogram, arg_load, client, parameters)
         hist_df = pd.concat(hist_dfs).reset_index(drop=True)
 
-    arg_plot = {
-        "year": parameters["years"],
-        "region": parameters["regions"],
-        "channel": parameters["channels"],
-        "var_name": [
-            v for v in hist_df.var_name.unique() if v in parameters["plot_vars"]
-        ],
-        "df": [hist_df],
-    }
+    # Index histograms by (year, var_name, dataset) once,
+    # merging histograms saved for separate partitions
+    hist_index = {}
+    for (year, var_name, dataset), hists in hist_df.groupby(
+        ["year", "var_name", "dataset"]
+    )["hist"]:
+        hist_index[(year, var_name, dataset)] = merge_histograms(hists.values)
+
+    var_names = [v for v in hist_df.var_name.unique() if v in parameters["plot_vars"]]
+    arg_plot = []
+    for year, region, channel, var_name in itertools.product(
+        parameters["years"], parameters["regions"], parameters["channels"], var_names
+    ):
+        hists = {
+            ds: h
+            for (y, v, ds), h in hist_index.items()
+            if (y == year) & (v == var_name)
+        }
+        arg_plot.append(
+            {
+                "year": year,
+                "region": region,
+                "channel": channel,
+                "var_name": var_name,
+                "hists": hists,
+            }
+        )
 
-    yields = parallelize(plot, arg_plot, client, parameters, seq=True)
+    # Plots are rendered in a process pool with the non-interactive Agg backend.
+    # Processes are spawned rather than forked, since the Dask client
+    # may have running threads.
+    nworkers = parameters.get("plot_nworkers", os.cpu_count())
+    with ProcessPoolExecutor(
+        max_workers=nworkers, mp_context=multiprocessing.get_context("spawn")
+    ) as pool:
+        yields = list(pool.map(partial(plot, parameters=parameters), arg_plot))
 
     return yields
 
 
+def plot_hash(hists, slicer, args, parameters):
+    # Content hash of the histogram slices and plotting options
+    options = {k: args[k] for k in ["year", "region", "channel", "var_name"]}
+    for key in ["grouping", "plot_groups", "plot_ratio", "14TeV_label"]:
+        options[key] = parameters.get(key)
+    # caption and binning of the variable
+    var = parameters["variables_lookup"].get(args["var_name"])
+    options["variable"] = None if var is None else vars(var)
+    md5 = hashlib.md5(json.dumps(options, sort_keys=True, default=str).encode())
+    for dataset in sorted(hists.keys()):
+        h = hists[dataset][slicer]
+        md5.update(dataset.encode())
+        md5.update(np.ascontiguousarray(h.values(flow=True)).tobytes())
+        for axis in h.axes:
+            md5.update(np.asarray(axis.edges).tobytes())
+    return md5.hexdigest()
+
+
 def plot(args, parameters={}):
     year = args["year"]
     region = args["region"]
     channel = args["channel"]
     var_name = args["var_name"]
-    hist = args["df"].loc[(args["df"].var_name == var_name) & (args["df"].year == year)]
+    hist = args["hists"]
 
     if var_name in parameters["variables_lookup"].keys():
         var = parameters["variables_lookup"][var_name]
     else:
         var = Variable(var_name, var_name, 50, 0, 5)
 
-    if hist.shape[0] == 0:
+    if len(hist) == 0:
         return
 
     plotsize = 8
@@ -111,6 +165,18 @@ def plot(args, parameters={}):
     if parameters["has_variations"]:
         slicer["variation"] = variation
 
+    # Skip plots whose inputs did not change since the last render
+    if parameters["save_plots"]:
+        path = parameters["plots_path"]
+        out_name = f"{path}/{var.name}_{year}_{channel}_{region}.png"
+        hash_name = f"{out_name}.hash"
+        content_hash = plot_hash(hist, slicer, args, parameters)
+        if os.path.exists(out_name) and os.path.exists(hash_name):
+            with open(hash_name) as f:
+                cached = json.load(f)
+            if cached["hash"] == content_hash:
+                return cached["yield"]
+
     fig = plt.figure()
 
     if parameters["plot_ratio"]:
@@ -242,10 +308,11 @@ def plot(args, parameters={}):
         hep.cms.label(ax=ax1, data=True, label="Preliminary", year=year)
 
     if parameters["save_plots"]:
-        path = parameters["plots_path"]
-        out_name = f"{path}/{var.name}_{year}_{channel}_{region}.png"
         fig.savefig(out_name)
+        with open(hash_name, "w") as f:
+            json.dump({"hash": content_hash, "yield": float(total_yield)}, f)
         print(f"Saved: {out_name}")
+    plt.close(fig)
 
     return total_yield
 
@@ -257,7 +324,7 @@ def get_plottables(hist, entry, year, var_name, slicer):
     slicer_value["val_sumw2"] = "value"
     slicer_sumw2["val_sumw2"] = "sumw2"
 
-    plottables_df = pd.DataFrame(columns=["label", "hist", "sumw2", "integral"])
+    plottables = []
 
     for group in entry.groups:
         group_entries = [e for e, g in entry.entry_dict.items() if (group == g)]
@@ -265,7 +332,10 @@ def get_plottables(hist, entry, year, var_name, slicer):
         hist_values_group = []
         hist_sumw2_group = []
 
-        for h in hist.loc[hist.dataset.isin(group_entries), "hist"].values:
+        for dataset in group_entries:
+            if dataset not in hist:
+                continue
+            h = hist[dataset]
             if not pd.isna(h[slicer_value].project(var_name).sum()):
                 hist_values_group.append(h[slicer_value].project(var_name))
                 hist_sumw2_group.append(h[slicer_sumw2].project(var_name))
@@ -275,19 +345,17 @@ def get_plottables(hist, entry, year, var_name, slicer):
 
         nevts = sum(hist_values_group).sum()
         if nevts > 0:
-            plottables_df = plottables_df.append(
-                pd.DataFrame(
-                    [
-                        {
-                            "label": group,
-                            "hist": sum(hist_values_group),
-                            "sumw2": sum(hist_sumw2_group),
-                            "integral": sum(hist_values_group).sum(),
-                        }
-                    ]
-                ),
-                ignore_index=True,
+            plottables.append(
+                {
+                    "label": group,
+                    "hist": sum(hist_values_group),
+                    "sumw2": sum(hist_sumw2_group),
+                    "integral": nevts,
+                }
             )
 
+    plottables_df = pd.DataFrame(
+        plottables, columns=["label", "hist", "sumw2", "integral"]
+    )
     plottables_df.sort_values(by="integral", inplace=True)
     return plottables_df
@@ -0,0 +1,123 @@
+import os
+import json
+import hashlib
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+import dask
+import dask.dataframe as dd
+
+from python.io import mkdir
+
+
+class Moments(object):
+    """
+    Mean and variance of features, accumulated in one pass with Welford's
+    algorithm. Accumulators filled on different partitions are merged
+    with `+`, giving the same result as a single pass over all data.
+    """
+
+    def __init__(self, nfeatures):
+        self.count = 0
+        self.mean = np.zeros(nfeatures)
+        self.m2 = np.zeros(nfeatures)
+
+    def update(self, x):
+        x = np.asarray(x, dtype=np.float64)
+        if x.shape[0] == 0:
+            return self
+        batch = Moments(x.shape[1])
+        batch.count = x.shape[0]
+        batch.mean = x.mean(axis=0)
+        batch.m2 = ((x - batch.mean) ** 2).sum(axis=0)
+        self.merge(batch)
+        return self
+
+    def merge(self, other):
+        count = self.count + other.count
+        if count == 0:
+            return self
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta * other.count / count
+        self.m2 = self.m2 + other.m2 + delta**2 * self.count * other.count / count
+        self.count = count
+        return self
+
+    def __add__(self, other):
+        ret = Moments(len(self.mean))
+        return ret.merge(self).merge(other)
+
+    @property
+    def std(self):
+        if self.count == 0:
+            return np.zeros(len(self.m2))
+        return np.sqrt(self.m2 / self.count)
+
+    def scalers(self):
+        # same layout as the saved scalers: [mean, std]
+        return np.array([self.mean, self.std])
+
+
+def feature_moments(data, features):
+    """
+    Moments of features in a pandas DataFrame, a Dask DataFrame
+    (one accumulator per partition, merged at the end), or an iterable
+    of pandas DataFrames (e.g. batches read from files).
+    """
+    if isinstance(data, pd.DataFrame):
+        return Moments(len(features)).update(data[features].values)
+    if isinstance(data, dd.DataFrame):
+        partials = [
+            dask.delayed(feature_moments)(part, features)
+            for part in data[features].to_delayed()
+        ]
+        return dask.delayed(sum)(partials, Moments(len(features))).compute()
+    moments = Moments(len(features))
+    for batch in data:
+        moments.update(batch[features].values)
+    return moments
+
+
+def scalers_key(features, fold, selection):
+    # fold: training folds; selection: description of datasets and cuts
+    selection_hash = hashlib.md5(
+        json.dumps(selection, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return hashlib.md5(
+        json.dumps([list(features), list(fold), selection_hash]).encode()
+    ).hexdigest()[:16]
+
+
+def get_scalers(features, fold, selection, data, out_path):
+    """
+    Scalers for a feature list, training folds and dataset selection.
+    They are computed from `data` only if they have not been saved yet,
+    so that models trained on the same inputs share them.
+    Returns the scalers and the path where they are saved (without .npy).
+    """
+    mkdir(out_path)
+    save_path = f"{out_path}/scalers_{scalers_key(features, fold, selection)}"
+    if os.path.exists(save_path + ".npy"):
+        return load_scalers(save_path + ".npy"), save_path
+    scalers = feature_moments(data, features).scalers()
+    np.save(save_path, scalers)
+    return scalers, save_path
+
+
+@lru_cache(maxsize=None)
+def load_scalers(path):
+    # Loaded once per process and reused across partitions
+    scalers = np.load(path).astype(np.float32)
+    scalers.setflags(write=False)
+    return scalers
+
+
+def normalize(x, scalers):
+    # In place if x is already a writeable float32 array
+    x = np.asarray(x, dtype=np.float32)
+    if not x.flags.writeable:
+        x = x.copy()
+    x -= scalers[0]
+    x /= scalers[1]
+    return x
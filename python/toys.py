@@ -0,0 +1,278 @@
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import ROOT as rt
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from python.fitter import Fitter, fit_models, requires_order, model_names
+
+rt.RooMsgService.instance().setGlobalKillBelow(rt.RooFit.ERROR)
+
+fitranges = {"low": 110, "high": 150, "SR_left": 120, "SR_right": 130}
+
+
+def run_toy_study(parameters, df):
+    """
+    Bias study: toys are generated from each background model (+ injected
+    signal) and fitted with each background model + signal model.
+    Toys are produced and fitted in batches in a process pool, and the
+    pulls of the fitted signal yield are streamed into a Parquet table.
+    """
+    signal_ds = parameters.get("signals", [])
+    gen_models = parameters.get("toys_gen_models", model_names["bkg"])
+    fit_models_ = parameters.get("toys_fit_models", model_names["bkg"])
+    ntoys = parameters.get("ntoys", 1000)
+    batch_size = parameters.get("toys_batch_size", 100)
+    out_path = parameters.get("toys_output", "bias_study.parquet")
+
+    low, high = fitranges["low"], fitranges["high"]
+    is_signal = df.dataset.isin(signal_ds)
+    in_range = (df.dimuon_mass > low) & (df.dimuon_mass < high)
+    shape_tasks = []
+    for channel in parameters["mva_channels"]:
+        for category in df["category"].dropna().unique():
+            cut = (df.channel == channel) & (df.category == category)
+            shape_tasks.append(
+                {
+                    "channel": channel,
+                    "category": category,
+                    "models": sorted(set(gen_models) | set(fit_models_)),
+                    "bkg_mass": df.loc[cut & ~is_signal, "dimuon_mass"].to_numpy(float),
+                    "sig_mass": df.loc[cut & is_signal, "dimuon_mass"].to_numpy(float),
+                    "nbkg": df.loc[cut & ~is_signal & in_range, "lumi_wgt"].sum(),
+                    "nsig": df.loc[cut & is_signal & in_range, "lumi_wgt"].sum(),
+                }
+            )
+
+    # ROOT is not thread-safe, so the toys are fitted in separate processes
+    nworkers = parameters.get("toys_nworkers", os.cpu_count())
+    if os.path.exists(out_path):
+        os.remove(out_path)
+    writer = None
+    try:
+        with ProcessPoolExecutor(
+            max_workers=nworkers, mp_context=multiprocessing.get_context("spawn")
+        ) as pool:
+            # Shapes are fitted once per (channel, category)
+            # and shared by all batches of toys
+            shapes = list(pool.map(fit_shapes, shape_tasks))
+            tasks = []
+            for shape_task, shape in zip(shape_tasks, shapes):
+                for gen_model in gen_models:
+                    for fit_model in fit_models_:
+                        for first_toy in range(0, ntoys, batch_size):
+                            tasks.append(
+                                {
+                                    "channel": shape_task["channel"],
+                                    "category": shape_task["category"],
+                                    "gen_model": gen_model,
+                                    "fit_model": fit_model,
+                                    "first_toy": first_toy,
+                                    "ntoys": min(batch_size, ntoys - first_toy),
+                                    "seed": len(tasks),
+                                    "shapes": shape,
+                                    "nbkg": shape_task["nbkg"],
+                                    "nsig": shape_task["nsig"],
+                                }
+                            )
+            futures = [pool.submit(toy_batch, task, parameters) for task in tasks]
+            for future in as_completed(futures):
+                table = pa.Table.from_pandas(future.result(), preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(out_path, table.schema)
+                writer.write_table(table)
+    except Exception:
+        # don't leave a truncated table behind
+        if writer is not None:
+            writer.close()
+            writer = None
+            os.remove(out_path)
+        raise
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if not os.path.exists(out_path):
+        print("No toys were generated")
+        return None
+    pulls = pd.read_parquet(out_path)
+    summary = (
+        pulls[pulls.status == 0]
+        .groupby(["channel", "category", "gen_model", "fit_model"])["pull"]
+        .median()
+    )
+    print(summary)
+    return out_path
+
+
+def make_fitter(channel):
+    return Fitter(
+        fitranges=fitranges,
+        fitmodels=fit_models,
+        requires_order=requires_order,
+        channel=channel,
+        binned=True,
+    )
+
+
+def fit_shapes(args):
+    # Background shapes are fitted to the full mass distribution,
+    # signal shape is fitted to signal MC.
+    # Returns fitted parameter values {model_key: {name: value}}
+    channel = args["channel"]
+    category = args["category"]
+    the_fitter = make_fitter(channel)
+    the_fitter.simple_fit(
+        dataset=args["bkg_mass"],
+        label="background",
+        category=category,
+        model_names=args["models"],
+        save=False,
+    )
+    shapes = dict(the_fitter.fit_params["ds_background"])
+    if len(args["sig_mass"]) > 0:
+        the_fitter.simple_fit(
+            dataset=args["sig_mass"],
+            label="signal",
+            category=category,
+            model_names=["dcb"],
+            save=False,
+        )
+        shapes.update(the_fitter.fit_params["ds_signal"])
+    else:
+        # the signal shape keeps its initial parameters
+        print(f"No signal events in {channel} {category}, signal shape is not fitted")
+    return shapes
+
+
+def toy_batch(args, parameters={}):
+    channel = args["channel"]
+    category = args["category"]
+    gen_model = args["gen_model"]
+    fit_model = args["fit_model"]
+    nbkg_exp = args["nbkg"]
+    method = parameters.get("toys_method", "numpy")
+    mu = parameters.get("toys_signal_strength", 0.0)
+    nsig_inj = mu * args["nsig"]
+
+    the_fitter = make_fitter(channel)
+    x = the_fitter.workspace.obj("mass")
+    tag = f"_{channel}_{category}"
+    pdfs = {}
+    for model_name in sorted({gen_model, fit_model, "dcb"}):
+        the_fitter.add_model(model_name, category=category)
+        pdfs[model_name] = the_fitter.workspace.pdf(model_name + tag)
+        values = args["shapes"].get(model_name + tag, {})
+        for param in pdfs[model_name].getParameters(rt.RooArgSet(x)):
+            if param.GetName() in values:
+                param.setVal(values[param.GetName()])
+    gen_pdf = pdfs[gen_model]
+    fit_pdf = pdfs[fit_model]
+    sig_pdf = pdfs["dcb"]
+    # signal shape is fixed in the toy fits
+    sig_pdf.getParameters(rt.RooArgSet(x)).setAttribAll("Constant")
+
+    seed = np.random.SeedSequence(
+        parameters.get("toys_seed", 0), spawn_key=(args["seed"],)
+    )
+    toys = generate_toys(
+        the_fitter,
+        gen_pdf,
+        sig_pdf,
+        nbkg_exp,
+        nsig_inj,
+        args["ntoys"],
+        seed,
+        method=method,
+    )
+
+    # Extended signal + background model used to fit the toys
+    nsig_range = 10 * np.sqrt(nbkg_exp) + 10 * abs(nsig_inj) + 10
+    nsig = rt.RooRealVar("nsig" + tag, "nsig", nsig_inj, -nsig_range, nsig_range)
+    nbkg = rt.RooRealVar("nbkg" + tag, "nbkg", nbkg_exp, 0, 3 * nbkg_exp + 10)
+    model = rt.RooAddPdf(
+        "toy_model" + tag,
+        "toy_model",
+        rt.RooArgList(sig_pdf, fit_pdf),
+        rt.RooArgList(nsig, nbkg),
+    )
+
+    # Toy fits start from the shape fitted to the input data
+    fit_params = fit_pdf.getParameters(rt.RooArgSet(x))
+    snapshot = fit_params.snapshot()
+
+    results = {"nsig": [], "nsig_err": [], "status": []}
+    for toy in toys:
+        fit_params.assignValueOnly(snapshot)
+        nsig.setVal(nsig_inj)
+        nbkg.setVal(nbkg_exp)
+        fit_result = model.fitTo(
+            toy,
+            rt.RooFit.Extended(True),
+            rt.RooFit.Save(),
+            rt.RooFit.PrintLevel(-1),
+            rt.RooFit.Verbose(rt.kFALSE),
+        )
+        results["nsig"].append(nsig.getVal())
+        results["nsig_err"].append(nsig.getError())
+        results["status"].append(fit_result.status())
+
+    ret = pd.DataFrame(results)
+    ret["pull"] = (ret.nsig - nsig_inj) / ret.nsig_err.where(ret.nsig_err > 0)
+    ret["nsig_injected"] = nsig_inj
+    ret["toy"] = np.arange(args["first_toy"], args["first_toy"] + len(ret))
+    ret["channel"] = channel
+    ret["category"] = category
+    ret["gen_model"] = gen_model
+    ret["fit_model"] = fit_model
+    return ret
+
+
+def generate_toys(fitter, gen_pdf, sig_pdf, nbkg, nsig, ntoys, seed, method="numpy"):
+    x = fitter.workspace.obj("mass")
+    if method == "roofit":
+        rt.RooRandom.randomGenerator().SetSeed(int(seed.generate_state(1)[0]))
+        # Toys are binned with a named binning, so that the default
+        # binning of the shared mass variable is not changed
+        x.setBinning(rt.RooUniformBinning(x.getMin(), x.getMax(), fitter.nbins), "toys")
+        nbkg_var = rt.RooRealVar("nbkg_gen", "nbkg_gen", nbkg)
+        nsig_var = rt.RooRealVar("nsig_gen", "nsig_gen", nsig)
+        pdf = rt.RooAddPdf(
+            "gen_model",
+            "gen_model",
+            rt.RooArgList(sig_pdf, gen_pdf),
+            rt.RooArgList(nsig_var, nbkg_var),
+        )
+        toys = []
+        for i in range(ntoys):
+            events = pdf.generate(rt.RooArgSet(x), rt.RooFit.Extended(True))
+            toy = rt.RooDataHist(f"toy_{i}", f"toy_{i}", rt.RooArgSet(x), "toys")
+            toy.add(events)
+            toys.append(toy)
+        return toys
+
+    # Sample Poisson counts for all toys at once from the binned PDF shapes
+    edges = np.linspace(x.getMin(), x.getMax(), fitter.nbins + 1)
+    expected = nbkg * binned_shape(gen_pdf, x, edges) + nsig * binned_shape(
+        sig_pdf, x, edges
+    )
+    rng = np.random.default_rng(seed)
+    counts = rng.poisson(np.clip(expected, 0, None), size=(ntoys, len(expected)))
+    return [
+        fitter.make_datahist(c, c, x, ds_name=f"toy_{i}") for i, c in enumerate(counts)
+    ]
+
+
+def binned_shape(pdf, x, edges):
+    # PDF evaluated at bin centers, normalized to unit sum over the range
+    norm_set = rt.RooArgSet(x)
+    centers = 0.5 * (edges[1:] + edges[:-1])
+    values = np.empty(len(centers))
+    for i, center in enumerate(centers):
+        x.setVal(center)
+        values[i] = pdf.getVal(norm_set)
+    return values / values.sum()
@@ -5,14 +5,27 @@ os.environ["TF_CPP_MIN_LOG_LEVEL"] = "3"
 import pickle
 import pandas as pd
 import numpy as np
-from sklearn.metrics import roc_curve
 import matplotlib.pyplot as plt
 import mplhep as hep
+import xgboost as xgb
 from tensorflow.keras.models import load_model
 import tensorflow.keras.backend as K
 
 from python.workflow import parallelize
 from python.io import mkdir
+from python.mva_data import ParquetFeed
+from python.categorizer import categorize
+from python.scalers import get_scalers, load_scalers, normalize
+from python.inference import export_model
+from python.mva_diagnostics import (
+    make_histogram,
+    class_histograms,
+    roc_curve,
+    auc,
+    shapes_in_bins,
+    max_abs_eta,
+    get_column,
+)
 from python.convert import to_histograms
 from python.plotter import plotter
 from python.variable import Variable
@@ -24,16 +37,19 @@ style["mathtext.default"] = "rm"
 plt.style.use(style)
 
 
-def run_mva(client, parameters, df):
+def run_mva(client, parameters, df=None):
     mva_path = parameters.pop("mva_path", "./")
     mkdir(mva_path)
     mva_models = parameters.pop("mva_models", {})
     saved_models = parameters.pop("saved_models", {})
     training_datasets = parameters.pop("training_datasets", {})
     features = parameters.pop("training_features", [])
+    # stage1 Parquet files to stream training data from, instead of df
+    training_paths = parameters.pop("training_paths", [])
     do_training = parameters.pop("mva_do_training", False)
     do_evaluation = parameters.pop("mva_do_evaluation", False)
     do_plotting = parameters.pop("mva_do_plotting", False)
+    export_models = parameters.pop("mva_export_models", True)
     channels_to_use = parameters.get("mva_channels", ["ggh_0jets"])
 
     for channel in channels_to_use:
@@ -42,12 +58,14 @@ def run_mva(client, parameters, df):
         parameters["plots_path"] = out_dir
 
         trainer = Trainer(
-            df=df[df.channel == channel],
+            df=pd.DataFrame() if df is None else df[df.channel == channel],
+            input_paths=training_paths,
             channel=channel,
             ds_dict=training_datasets,
             features=features,
             out_path=out_dir,
             training_cut="(dimuon_mass > 110) & (dimuon_mass < 150)",
+            export_models=export_models,
         )
         # trainer.shape_in_eta_bins(shape_of="dimuon_mass", nbins=10)
 
@@ -59,7 +77,7 @@ def run_mva(client, parameters, df):
             if len(saved_models[channel].keys()) > 0:
                 trainer.add_saved_models(saved_models[channel])
 
-        if do_evaluation:
+        if do_evaluation and (df is not None):
             trainer.run_evaluation(client)
             trainer.shape_in_bins(shape_of="dimuon_mass", nbins=6)
             # trainer.shape_in_bins(shape_of="max_abs_eta", nbins=10)
@@ -70,7 +88,7 @@ def run_mva(client, parameters, df):
                     :, score_name
                 ]
 
-        if do_plotting:
+        if do_plotting and (df is not None):
             trainer.plot_roc_curves()
             parameters_tmp = parameters.copy()
             parameters_tmp["hist_vars"] = []
@@ -98,11 +116,14 @@ def run_mva(client, parameters, df):
 class Trainer(object):
     def __init__(self, **kwargs):
         self.df = kwargs.pop("df", pd.DataFrame())
+        # If set, models are trained on data streamed from these files
+        self.input_paths = kwargs.pop("input_paths", [])
         self.channel = kwargs.pop("channel", "")
         self.ds_dict = kwargs.pop("ds_dict", {})
         self.features = kwargs.pop("features", [])
         self.out_path = kwargs.pop("out_path", "./")
         self.training_cut = kwargs.pop("training_cut", None)
+        self.export_models = kwargs.pop("export_models", True)
         self.models = {}
         self.trained_models = {}
         self.scalers = {}
@@ -112,8 +133,9 @@ class Trainer(object):
         print()
         print("*" * 60)
         print("In channel", self.channel)
-        print("Event counts in classes:")
-        print(self.df["class_name"].value_counts())
+        if "class_name" in self.df.columns:
+            print("Event counts in classes:")
+            print(self.df["class_name"].value_counts())
         print("Training features:")
         print(self.features)
 
@@ -144,24 +166,27 @@ class Trainer(object):
             fold_filters["step"] = step
             for fname, folds in folds_def.items():
                 folds_shifted = [(step + f) % self.nfolds for f in folds]
-                fold_filters[f"{fname}_filter"] = self.df.event.mod(self.nfolds).isin(
-                    folds_shifted
-                )
+                fold_filters[f"{fname}_folds"] = folds_shifted
+                if "event" in self.df.columns:
+                    fold_filters[f"{fname}_filter"] = self.df.event.mod(
+                        self.nfolds
+                    ).isin(folds_shifted)
             self.fold_filters_list.append(fold_filters)
 
     def fix_variables(self):
-        self.df.loc[:, "mu1_pt_over_mass"] = self.df.mu1_pt / self.df.dimuon_mass
-        self.df.loc[:, "mu2_pt_over_mass"] = self.df.mu2_pt / self.df.dimuon_mass
+        if self.df.shape[0] > 0:
+            self.df = add_derived_features(self.df)
 
     def prepare_dataset(self):
         # Ignore features that have incorrect values
-        # (we handle them by categorizing data by njets)
-        ignore_features = self.df.loc[:, self.df.min(axis=0) == -999.0].columns
-        features_clean = []
-        for c in self.df.columns:
-            if (c in self.features) and (c not in ignore_features):
-                features_clean.append(c)
-        self.features = features_clean
+        # (we handle them by categorizing data by njets).
+        if self.df.shape[0] > 0:
+            ignore_features = self.df.loc[:, self.df.min(axis=0) == -999.0].columns
+            features_clean = []
+            for c in self.df.columns:
+                if (c in self.features) and (c not in ignore_features):
+                    features_clean.append(c)
+            self.features = features_clean
 
         # Convert dictionary of datasets to a more useful dataframe
         df_info = pd.DataFrame()
@@ -175,14 +200,39 @@ class Trainer(object):
                     df_info.loc[ds, "class_name"] = cls
                     df_info.loc[ds, "iclass"] = icls
         df_info["iclass"] = df_info["iclass"].fillna(-1).astype(int)
+        cls_map = dict(df_info[["dataset", "iclass"]].values)
+        cls_name_map = dict(df_info[["dataset", "class_name"]].values)
+        self.class_map = {ds: cls_map[ds] for ds in self.train_samples}
+        if self.df.shape[0] == 0:
+            if len(self.input_paths) > 0:
+                self.clean_features_from_files()
+            return
         self.df = self.df[self.df.dataset.isin(df_info.dataset.unique())]
 
         # Assign numerical classes to each event
-        cls_map = dict(df_info[["dataset", "iclass"]].values)
-        cls_name_map = dict(df_info[["dataset", "class_name"]].values)
         self.df["class"] = self.df.dataset.map(cls_map)
         self.df["class_name"] = self.df.dataset.map(cls_name_map)
 
+    def feed_args(self):
+        # Selection of streamed events, same as for the in-memory dataframe
+        return {
+            "cut": self.training_cut,
+            "selection": {"channel": self.channel},
+            "transform": prepare_batch,
+            "extra_columns": derived_feature_inputs + channel_inputs,
+        }
+
+    def clean_features_from_files(self):
+        # Same as in prepare_dataset, with minima computed batch by batch
+        feed = ParquetFeed(
+            self.input_paths, self.features, self.class_map, **self.feed_args()
+        )
+        minima = [batch[self.features].min() for batch in feed.batches()]
+        if len(minima) == 0:
+            return
+        minimum = pd.concat(minima, axis=1).min(axis=1)
+        self.features = [c for c in self.features if minimum[c] != -999.0]
+
     def add_models(self, model_dict):
         if self.channel in model_dict.keys():
             self.models = model_dict[self.channel]
@@ -253,6 +303,9 @@ class Trainer(object):
             self.df.loc[eval_filter, score_name] = ret["prediction"]
 
     def train_model(self, args, parameters={}):
+        if len(self.input_paths) > 0:
+            return self.train_model_from_files(args)
+
         model_name = args["model_name"]
         fold_filters = args["fold_filters"]
         step = fold_filters["step"]
@@ -266,24 +319,19 @@ class Trainer(object):
         train_filter = fold_filters["train_filter"]
         val_filter = fold_filters["val_filter"]
 
-        other_columns = ["event", "lumi_wgt", "mc_wgt"]
-
-        x_train = df.loc[train_filter, self.features]
+        scalers, scalers_save_path = self.fit_scalers(
+            df.loc[train_filter], fold_filters["train_folds"], model_name, step
+        )
+        x_train = normalize(
+            df.loc[train_filter, self.features].to_numpy(dtype=np.float32, copy=True),
+            scalers,
+        )
         y_train = df.loc[train_filter, "class"]
-        x_val = df.loc[val_filter, self.features]
-        y_val = df.loc[val_filter, "class"]
-
-        normalized, scalers_save_path = self.normalize_data(
-            reference=x_train,
-            features=self.features,
-            to_normalize_dict={"x_train": x_train, "x_val": x_val},
-            model_name=model_name,
-            step=step,
+        x_val = normalize(
+            df.loc[val_filter, self.features].to_numpy(dtype=np.float32, copy=True),
+            scalers,
         )
-        x_train = normalized["x_train"]
-        x_val = normalized["x_val"]
-        x_train[other_columns] = df.loc[train_filter, other_columns]
-        x_val[other_columns] = df.loc[val_filter, other_columns]
+        y_val = df.loc[val_filter, "class"]
 
         model = self.models[model_name]["model"]
         model_type = self.models[model_name]["type"]
@@ -297,12 +345,12 @@ class Trainer(object):
                 loss="binary_crossentropy", optimizer="adam", metrics=["accuracy"]
             )
             history = model.fit(
-                x_train[self.features],
+                x_train,
                 y_train,
                 epochs=100,
                 batch_size=1024,
                 verbose=0,
-                validation_data=(x_val[self.features], y_val),
+                validation_data=(x_val, y_val),
                 shuffle=True,
             )
             model_save_path = f"{out_path}/model_{model_name}_{step}.h5"
@@ -325,7 +373,7 @@ class Trainer(object):
             )
 
             history = model.fit(
-                x_train[self.features],
+                x_train,
                 {
                     "classifier": df.loc[train_filter, "class"],
                     "adversary": df.loc[train_filter, "dimuon_mass"],
@@ -334,7 +382,7 @@ class Trainer(object):
                 batch_size=1024,
                 verbose=0,
                 validation_data=(
-                    x_val[self.features],
+                    x_val,
                     {
                         "classifier": df.loc[val_filter, "class"],
                         "adversary": df.loc[val_filter, "dimuon_mass"],
@@ -353,13 +401,13 @@ class Trainer(object):
 
         elif model_type == "bdt":
             model.fit(
-                x_train[self.features],
+                x_train,
                 y_train,
                 early_stopping_rounds=50,
                 eval_metric="logloss",
                 eval_set=[
-                    (x_train[self.features], y_train),
-                    (x_val[self.features], y_val),
+                    (x_train, y_train),
+                    (x_val, y_val),
                 ],
                 verbose=False,
             )
@@ -371,6 +419,115 @@ class Trainer(object):
                 "val_loss": results["validation_1"]["logloss"],
             }
 
+        if self.export_models:
+            # portable copies (ONNX / XGBoost JSON) for evaluation in stage2
+            export_model(model_save_path)
+        self.plot_history(losses, model_name, step)
+
+        print(f"Done training: model {model_name}, step #{step+1} out of {self.nfolds}")
+
+        ret = {
+            "model_name": model_name,
+            "step": step,
+            "model_save_path": model_save_path,
+            "scalers_save_path": scalers_save_path,
+        }
+        return ret
+
+    def train_model_from_files(self, args):
+        # Training and validation data are streamed from Parquet files
+        # in batches, so that they don't have to fit in memory
+        model_name = args["model_name"]
+        fold_filters = args["fold_filters"]
+        step = fold_filters["step"]
+
+        print(f"Training model {model_name}, step #{step+1} out of {self.nfolds}...")
+        K.clear_session()
+
+        feed_args = {"nfolds": self.nfolds, **self.feed_args()}
+        train_feed = ParquetFeed(
+            self.input_paths,
+            self.features,
+            self.class_map,
+            folds=fold_filters["train_folds"],
+            **feed_args,
+        )
+        val_feed = ParquetFeed(
+            self.input_paths,
+            self.features,
+            self.class_map,
+            folds=fold_filters["val_folds"],
+            **feed_args,
+        )
+
+        scalers, scalers_save_path = self.fit_scalers(
+            train_feed.batches(), fold_filters["train_folds"], model_name, step
+        )
+        train_feed.set_scalers(scalers)
+        val_feed.set_scalers(scalers)
+
+        model = self.models[model_name]["model"]
+        model_type = self.models[model_name]["type"]
+
+        out_path = f"{self.out_path}/models/"
+        mkdir(out_path)
+
+        if model_type in ["dnn", "dnn_adv"]:
+            if model_type == "dnn":
+                model = model(len(self.features), label="test")
+                labels = "class"
+                model.compile(
+                    loss="binary_crossentropy", optimizer="adam", metrics=["accuracy"]
+                )
+            else:
+                model = model(len(self.features), label="test_adv")
+                labels = {"classifier": "class", "adversary": "dimuon_mass"}
+                model.compile(
+                    loss={"classifier": "binary_crossentropy", "adversary": "mse"},
+                    loss_weights={"classifier": 1, "adversary": -1},
+                    optimizer="adam",
+                    metrics=["accuracy"],
+                )
+            history = model.fit(
+                train_feed.tf_dataset(labels=labels),
+                epochs=100,
+                verbose=0,
+                validation_data=val_feed.tf_dataset(labels=labels, shuffle_buffer=0),
+            )
+            model_save_path = f"{out_path}/model_{model_name}_{step}.h5"
+            model.save(model_save_path)
+            K.clear_session()
+            losses = {
+                "train_loss": history.history["loss"],
+                "val_loss": history.history["val_loss"],
+            }
+
+        elif model_type == "bdt":
+            cache = f"{out_path}/cache_{model_name}_{step}"
+            dtrain = train_feed.dmatrix(f"{cache}_train")
+            dval = val_feed.dmatrix(f"{cache}_val")
+            params = model.get_xgb_params()
+            params["eval_metric"] = "logloss"
+            results = {}
+            booster = xgb.train(
+                params,
+                dtrain,
+                num_boost_round=model.n_estimators or 100,
+                evals=[(dtrain, "validation_0"), (dval, "validation_1")],
+                early_stopping_rounds=50,
+                evals_result=results,
+                verbose_eval=False,
+            )
+            model_save_path = f"{out_path}/model_{model_name}_{step}.json"
+            booster.save_model(model_save_path)
+            losses = {
+                "train_loss": results["validation_0"]["logloss"],
+                "val_loss": results["validation_1"]["logloss"],
+            }
+
+        if self.export_models:
+            # portable copies (ONNX / XGBoost JSON) for evaluation in stage2
+            export_model(model_save_path)
         self.plot_history(losses, model_name, step)
 
         print(f"Done training: model {model_name}, step #{step+1} out of {self.nfolds}")
@@ -393,29 +550,33 @@ class Trainer(object):
         K.clear_session()
 
         eval_filter = fold_filters["eval_filter"]
-        other_columns = ["event", "lumi_wgt", "mc_wgt"]
-
-        scalers = np.load(self.scalers[model_name][step] + ".npy")
-        x_eval = (df.loc[eval_filter, self.features] - scalers[0]) / scalers[1]
+        scalers = load_scalers(self.scalers[model_name][step] + ".npy")
+        x_eval = normalize(
+            df.loc[eval_filter, self.features].to_numpy(dtype=np.float32, copy=True),
+            scalers,
+        )
         if x_eval.shape[0] == 0:
             return {"model_name": model_name, "step": step, "prediction": []}
 
-        x_eval[other_columns] = df.loc[eval_filter, other_columns]
-
         model_type = self.models[model_name]["type"]
         if model_type == "dnn":
             model = load_model(self.trained_models[model_name][step])
-            prediction = np.array(model.predict(x_eval[self.features])).ravel()
+            prediction = np.array(model.predict(x_eval)).ravel()
             K.clear_session()
         if model_type == "dnn_adv":
             model = load_model(self.trained_models[model_name][step])
-            prediction = np.array(model.predict(x_eval[self.features])[0]).ravel()
+            prediction = np.array(model.predict(x_eval)[0]).ravel()
             K.clear_session()
         elif model_type == "bdt":
-            model = pickle.load(open(self.trained_models[model_name][step], "rb"))
-            prediction = np.array(
-                model.predict_proba(x_eval[self.features])[:, 1]
-            ).ravel()
+            model_path = self.trained_models[model_name][step]
+            if model_path.endswith(".json"):
+                # models trained on streamed data are saved as native boosters
+                model = xgb.Booster()
+                model.load_model(model_path)
+                prediction = model.predict(xgb.DMatrix(x_eval))
+            else:
+                model = pickle.load(open(model_path, "rb"))
+                prediction = np.array(model.predict_proba(x_eval)[:, 1]).ravel()
 
         print(
             f"Done evaluating: model {model_name}, step #{step+1} out of {self.nfolds}"
@@ -424,19 +585,31 @@ class Trainer(object):
         ret = {"model_name": model_name, "step": step, "prediction": prediction}
         return ret
 
-    def normalize_data(self, reference, features, to_normalize_dict, model_name, step):
-        mean = np.mean(reference[features].values, axis=0)
-        std = np.std(reference[features].values, axis=0)
-        out_path = f"{self.out_path}/scalers/"
-        mkdir(out_path)
-        save_path = f"{out_path}/scalers_{model_name}_{step}"
-        np.save(save_path, [mean, std])
-
-        normalized = {}
-        for key, item in to_normalize_dict.items():
-            item_normalized = (item[features] - mean) / std
-            normalized[key] = item_normalized
-        return normalized, save_path
+    def fit_scalers(self, data, folds, model_name, step):
+        # Scalers only depend on the features and the training events,
+        # so they are computed once and shared by all models.
+        # A copy is saved for each model, as expected by add_saved_models.
+        selection = {
+            "datasets": sorted(self.train_samples),
+            "channel": self.channel,
+            "cut": self.training_cut,
+            "nfolds": self.nfolds,
+        }
+        if len(self.input_paths) > 0:
+            selection["files"] = [
+                [path, os.path.getsize(path), os.path.getmtime(path)]
+                for path in sorted(self.input_paths)
+            ]
+        else:
+            selection["data_hash"] = int(
+                pd.util.hash_pandas_object(data[self.features], index=False).sum()
+            )
+        scalers, _ = get_scalers(
+            self.features, folds, selection, data, f"{self.out_path}/scalers/"
+        )
+        save_path = f"{self.out_path}/scalers/scalers_{model_name}_{step}"
+        np.save(save_path, scalers)
+        return scalers, save_path
 
     def plot_history(self, losses, model_name, step):
         fig = plt.figure()
@@ -455,20 +628,14 @@ class Trainer(object):
         fig.savefig(out_name)
 
     def plot_roc_curves(self):
-        roc_curves = {}
         fig = plt.figure()
         fig, ax = plt.subplots()
         df = self.df[self.df.dataset.isin(self.train_samples)]
         for model_name, model in self.models.items():
             score_name = f"{model_name}_score"
-            roc_curves[score_name] = roc_curve(
-                y_true=df["class"],
-                y_score=df[score_name],
-                sample_weight=df["lumi_wgt"],  # * df["mc_wgt"],
-            )
-            ax.plot(
-                roc_curves[score_name][0], roc_curves[score_name][1], label=score_name
-            )
+            hists = class_histograms(df, score_name, class_column="class")
+            fpr, tpr, _ = roc_curve(hists[1], hists[0])
+            ax.plot(fpr, tpr, label=f"{score_name} (AUC={auc(fpr, tpr):.3f})")
         ax.legend(prop={"size": "x-small"})
         ax.set_xlabel("FPR")
         ax.set_ylabel("TPR")
@@ -478,94 +645,75 @@ class Trainer(object):
     def shape_in_bins(self, shape_of="dimuon_mass", nbins=4):
         for model_name in self.models.keys():
             score_name = f"{model_name}_score"
-            for cls in self.df["class_name"].dropna().unique():
-                df = self.df[self.df["class_name"] == cls]
-                score = df[score_name]
-                fig = plt.figure()
-                fig, ax = plt.subplots()
-
-                for i in range(nbins):
-                    cut_lo = score.quantile(i / nbins)
-                    cut_hi = score.quantile((i + 1) / nbins)
-                    cut = (score > cut_lo) & (score < cut_hi)
-                    if shape_of == "max_abs_eta":
-                        data = df.loc[cut].apply(max_abs_eta, axis=1)
-                    else:
-                        data = df.loc[cut, shape_of]
-
-                    if shape_of == "dimuon_mass":
-                        data_range = (115, 135)
-                        data_bins = 80
-                    else:
-                        data_range = (data.min(), data.max())
-                        data_bins = 25
-                    weights = (df.lumi_wgt).loc[cut].values
-                    # weights = (df.lumi_wgt * df.mc_wgt).loc[cut].values
-                    hist = np.histogram(
-                        data.values,
-                        bins=data_bins,
-                        range=data_range,
-                        weights=weights,
-                        density=True,
-                    )
-                    hep.histplot(
-                        hist[0],
-                        hist[1],
-                        histtype="step",
-                        label=f"{score_name} bin #{i}",
-                    )
-                ax.legend(prop={"size": "x-small"})
-                ax.set_xlabel(shape_of)
-                ax.set_yscale("log")
-                ax.set_ylim(0.0001, 1)
-                out_name = f"{self.out_path}/shapes_{score_name}_{cls}_{shape_of}.png"
-                fig.savefig(out_name)
+            self.plot_shapes(score_name, (0, 1), shape_of, nbins, f"{score_name} bin #")
 
     def shape_in_eta_bins(self, shape_of="dimuon_mass", nbins=4):
+        var_range = (0, max_abs_eta(self.df).max())
+        self.plot_shapes("max_abs_eta", var_range, shape_of, nbins, "max |eta|: ")
+
+    def plot_shapes(self, var, var_range, shape_of, nbins, label):
+        # Shapes of a variable in bins of equal yield of another variable
+        if shape_of == "dimuon_mass":
+            shape_range = (115, 135)
+            shape_bins = 80
+        else:
+            data = get_column(self.df, shape_of)
+            shape_range = (data.min(), data.max())
+            shape_bins = 25
 
         for cls in self.df["class_name"].dropna().unique():
             df = self.df[self.df["class_name"] == cls]
-            score = df.apply(max_abs_eta, axis=1)
+            hist_2d = make_histogram(
+                df,
+                var,
+                var_range=var_range,
+                shape_of=shape_of,
+                shape_bins=shape_bins,
+                shape_range=shape_range,
+            )
             fig = plt.figure()
             fig, ax = plt.subplots()
-
-            for i in range(nbins):
-                cut_lo = score.quantile(i / nbins)
-                cut_hi = score.quantile((i + 1) / nbins)
-                cut = (score > cut_lo) & (score < cut_hi)
-                if shape_of == "max_abs_eta":
-                    data = df.loc[cut].apply(max_abs_eta, axis=1)
+            shapes = shapes_in_bins(hist_2d, nbins=nbins)
+            for i, (lo, hi, values, edges) in enumerate(shapes):
+                if var == "max_abs_eta":
+                    bin_label = f"{label}[{round(lo, 2)}, {round(hi, 2)}]"
                 else:
-                    data = df.loc[cut, shape_of]
-
-                if shape_of == "dimuon_mass":
-                    data_range = (115, 135)
-                    data_bins = 80
-                else:
-                    data_range = (data.min(), data.max())
-                    data_bins = 25
-                # weights = (df.lumi_wgt * df.mc_wgt).loc[cut].values
-                weights = (df.lumi_wgt).loc[cut].values
-                hist = np.histogram(
-                    data.values,
-                    bins=data_bins,
-                    range=data_range,
-                    weights=weights,
-                    density=True,
-                )
-                cut_lo = round(cut_lo, 2)
-                cut_hi = round(cut_hi, 2)
-                hep.histplot(
-                    hist[0],
-                    hist[1],
-                    histtype="step",
-                    label=f"max |eta|: [{cut_lo}, {cut_hi}]",
-                )
+                    bin_label = f"{label}{i}"
+                hep.histplot(values, edges, histtype="step", label=bin_label)
             ax.legend(prop={"size": "x-small"})
             ax.set_xlabel(shape_of)
-            out_name = f"{self.out_path}/shapes_eta_{cls}_{shape_of}.png"
+            if var == "max_abs_eta":
+                out_name = f"{self.out_path}/shapes_eta_{cls}_{shape_of}.png"
+            else:
+                ax.set_yscale("log")
+                ax.set_ylim(0.0001, 1)
+                out_name = f"{self.out_path}/shapes_{var}_{cls}_{shape_of}.png"
             fig.savefig(out_name)
+            plt.close(fig)
+
+
+# Columns needed to compute derived training features
+derived_feature_inputs = ["mu1_pt", "mu2_pt", "dimuon_mass"]
+
+
+def add_derived_features(df):
+    df = df.copy()
+    df["mu1_pt_over_mass"] = df.mu1_pt / df.dimuon_mass
+    df["mu2_pt_over_mass"] = df.mu2_pt / df.dimuon_mass
+    return df
+
+
+# Columns needed to assign channels to events streamed from stage1 files,
+# with or without the suffix of the nominal variation
+channel_inputs = [
+    f"{c}{suffix}"
+    for c in ["njets", "jj_mass", "jj_dEta", "jet1_pt", "nBtagLoose", "nBtagMedium"]
+    for suffix in ["", " nominal"]
+]
 
 
-def max_abs_eta(row):
-    return max(abs(row["mu1_eta"]), abs(row["mu2_eta"]))
+def prepare_batch(df):
+    # Stage1 files don't contain channels, they are assigned per batch
+    df = categorize(df, {"syst_variations": ["nominal"]})
+    df["channel"] = df["channel nominal"]
+    return add_derived_features(df)
@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+from python.workflow import parallelize
+from python.io import load_histogram, merge_histograms
+
+
+def yield_table(client, parameters, hist_df=None, var_name="dimuon_mass"):
+    """
+    Yields and statistical errors for every
+    (year, dataset, region, channel, variation), computed from the merged
+    histograms of a single variable within its range (flow bins are not
+    counted). Normalization effects of variations
+    are given relative to the nominal yield.
+    """
+    if hist_df is None:
+        arg_load = {
+            "year": parameters["years"],
+            "var_name": [var_name],
+            "dataset": parameters["datasets"],
+        }
+        hist_dfs = parallelize(load_histogram, arg_load, client, parameters)
+        hist_df = pd.concat(hist_dfs).reset_index(drop=True)
+
+    hist_df = hist_df[hist_df.var_name == var_name]
+    rows = []
+    for (year, dataset), hists in hist_df.groupby(["year", "dataset"])["hist"]:
+        # merge histograms saved for separate partitions
+        rows.append(
+            hist_yields(merge_histograms(hists.values), var_name, year, dataset)
+        )
+    if len(rows) == 0:
+        return pd.DataFrame()
+
+    yields = pd.concat(rows, ignore_index=True)
+    yields["group"] = yields.dataset.map(lambda ds: parameters["grouping"].get(ds, ds))
+    return add_norm_effects(yields)
+
+
+def hist_yields(hist, var_name, year, dataset):
+    # All (region, channel, variation) yields of a histogram in one pass
+    has_variations = "variation" in hist.axes.name
+    axes = ["region", "channel", "val_sumw2"]
+    if has_variations:
+        axes.append("variation")
+    # only events within the range of the variable, without flow bins
+    hist = hist[{var_name: slice(0, len, sum)}].project(*axes)
+    contents = hist.values(flow=False)
+    if not has_variations:
+        contents = contents[..., np.newaxis]
+
+    val_sumw2 = list(hist.axes["val_sumw2"])
+    values = contents[:, :, val_sumw2.index("value"), :]
+    sumw2 = contents[:, :, val_sumw2.index("sumw2"), :]
+
+    regions = list(hist.axes["region"])
+    channels = list(hist.axes["channel"])
+    variations = list(hist.axes["variation"]) if has_variations else ["nominal"]
+    index = pd.MultiIndex.from_product(
+        [regions, channels, variations], names=["region", "channel", "variation"]
+    )
+    ret = pd.DataFrame(
+        {
+            "yield": values.ravel(),
+            "stat_err": np.sqrt(np.clip(sumw2.ravel(), 0, None)),
+        },
+        index=index,
+    ).reset_index()
+    ret.insert(0, "dataset", dataset)
+    ret.insert(0, "year", year)
+    return ret
+
+
+def group_yields(yields):
+    # Sum yields over datasets in the same group
+    keys = ["year", "group", "region", "channel", "variation"]
+    grouped = yields.assign(sumw2=yields.stat_err**2).groupby(keys, as_index=False)
+    grouped = grouped.agg({"yield": "sum", "sumw2": "sum"})
+    grouped["stat_err"] = np.sqrt(grouped.pop("sumw2"))
+    return add_norm_effects(grouped, keys=keys)
+
+
+def add_norm_effects(
+    yields, keys=["year", "dataset", "group", "region", "channel", "variation"]
+):
+    # Relative change of the yield with respect to the nominal yield,
+    # e.g. for weight variations (_up, _down) or disabled weights (_off)
+    idx = [k for k in keys if k != "variation"]
+    nominal = yields.loc[yields.variation == "nominal", idx + ["yield"]].rename(
+        columns={"yield": "yield_nominal"}
+    )
+    yields = yields.drop(columns=["norm_effect"], errors="ignore")
+    yields = yields.merge(nominal, on=idx, how="left")
+    nom = yields.pop("yield_nominal")
+    yields["norm_effect"] = (yields["yield"] - nom) / nom.where(nom != 0)
+    return yields
+
+
+def save_yield_table(yields, path):
+    if path.endswith(".parquet"):
+        yields.to_parquet(path, index=False)
+    else:
+        yields.to_csv(path, index=False)
+    print(f"Saved yields to {path}")
@@ -2,16 +2,18 @@ import time
 import argparse
 import traceback
 from functools import partial
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError
 
 from coffea.processor import DaskExecutor, Runner
-from coffea.nanoevents import DelphesSchema
 
+from coffea_replacement.delphes import DelphesSchema
 from python.io import mkdir, save_dask_pandas_to_parquet
 from delphes.preprocessor import get_fileset
 from delphes.processor import DimuonProcessorDelphes
 from delphes.config.datasets import datasets
+from delphes.config.parameters import parameters as delphes_parameters
 
-from dask.distributed import Client
+from dask.distributed import Client, futures_of
 
 # dask.config.set({"temporary-directory": "/depot/cms/hmm/dask-temp/"})
 
@@ -41,6 +43,23 @@ parser.add_argument(
     action="store",
     help="Approximate chunk size",
 )
+parser.add_argument(
+    "-seq",
+    "--sequential",
+    dest="sequential",
+    default=False,
+    action="store_true",
+    help="Process datasets one at a time",
+)
+parser.add_argument(
+    "-t",
+    "--timeout",
+    dest="timeout",
+    default=None,
+    action="store",
+    help="Max. processing time in seconds when datasets are processed in "
+    "parallel (datasets not finished by then are cancelled and marked as failed)",
+)
 parser.add_argument(
     "-mch",
     "--maxchunks",
@@ -64,6 +83,7 @@ else:
     slurm_cluster_ip = f"{node_ip}:{args.slurm_port}"
 
 mch = None if int(args.maxchunks) < 0 else int(args.maxchunks)
+timeout = None if args.timeout is None else float(args.timeout)
 
 year = "snowmass"
 
@@ -77,6 +97,7 @@ parameters = {
     "maxchunks": mch,
     "local_cluster": local_cluster,
     "slurm_cluster_ip": slurm_cluster_ip,
+    "dataset_timeout": timeout,
     "lumi": 3000000.0,
     # "lumi": 59970.0,
 }
@@ -84,25 +105,32 @@ parameters = {
 parameters["out_dir"] = f"{parameters['global_out_path']}/{parameters['out_path']}"
 
 
-def submit_job(client, parameters):
+def submit_job(client, parameters, fileset=None, priority=0, status=True):
+    if fileset is None:
+        fileset = parameters["fileset"]
     mkdir(parameters["out_dir"])
     out_dir = f"{parameters['out_dir']}/"
     mkdir(out_dir)
 
-    executor_args = {"client": client, "retries": 0}
+    executor_args = {
+        "client": client,
+        "retries": 0,
+        "priority": priority,
+        "status": status,
+    }
     executor = DaskExecutor(**executor_args)
     processor_args = {
         "apply_to_output": partial(save_dask_pandas_to_parquet, out_dir=out_dir)
     }
     run = Runner(
         executor=executor,
-        schema=DelphesSchema,
+        schema=DelphesSchema.with_collections(delphes_parameters["collections"]),
         chunksize=parameters["chunksize"],
         maxchunks=parameters["maxchunks"],
     )
     try:
         run(
-            parameters["fileset"],
+            fileset,
             "Delphes",
             processor_instance=DimuonProcessorDelphes(**processor_args),
         )
@@ -113,6 +141,78 @@ def submit_job(client, parameters):
     return "Success!"
 
 
+def dataset_size(data):
+    # datasets saved without event counts are ranked by number of files
+    return data["metadata"].get("nevents", len(data["files"]))
+
+
+class FutureRecorder(object):
+    """Client wrapper that records the futures submitted through it"""
+
+    def __init__(self, client):
+        self.client = client
+        self.futures = []
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def record(self, ret):
+        self.futures.extend(futures_of(ret))
+        return ret
+
+    def submit(self, *args, **kwargs):
+        return self.record(self.client.submit(*args, **kwargs))
+
+    def map(self, *args, **kwargs):
+        return self.record(self.client.map(*args, **kwargs))
+
+    def compute(self, *args, **kwargs):
+        return self.record(self.client.compute(*args, **kwargs))
+
+
+def submit_datasets(client, parameters, fileset, timeout=None):
+    """
+    All datasets are submitted to the cluster at once, each as a separate
+    job with its own metadata, so that the workers stay busy while small
+    datasets finish and a failing or hanging dataset does not affect the
+    others. Chunks of larger datasets get higher priority, so that they
+    are started first and small datasets fill the remaining workers.
+    Datasets not finished `timeout` seconds after submission are cancelled.
+    """
+    order = sorted(fileset, key=lambda name: dataset_size(fileset[name]))
+    # futures of each dataset are recorded, so that they can be cancelled
+    recorders = {name: FutureRecorder(client) for name in order}
+    results = {}
+    pool = ThreadPoolExecutor(max_workers=max(len(order), 1))
+    futures = {
+        pool.submit(
+            submit_job,
+            recorders[name],
+            parameters,
+            fileset={name: fileset[name]},
+            priority=priority,
+            status=False,
+        ): name
+        for priority, name in enumerate(order)
+    }
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            name = futures[future]
+            results[name] = future.result()
+            print(name, results[name])
+    except TimeoutError:
+        for name in order:
+            if name in results:
+                continue
+            # the job of this dataset fails once its futures are cancelled
+            client.cancel(recorders[name].futures)
+            results[name] = f"Failed: not finished after {timeout} s"
+            print(name, results[name])
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return results
+
+
 if __name__ == "__main__":
     tick = time.time()
     if parameters["local_cluster"]:
@@ -153,6 +253,7 @@ if __name__ == "__main__":
         my_datasets,
         parameters,
         save_to=fileset_json,
+        catalog="/depot/cms/hmm/coffea/snowmass_file_catalog.json",
         # load_from=fileset_json,
     )
 
@@ -166,13 +267,21 @@ if __name__ == "__main__":
     # import sys
     # sys.exit()
 
-    # Process datasets individually
-    for name, data in fileset.items():
-        if name not in ds_names:
-            continue
-        parameters["fileset"] = {name: data}
-        out = submit_job(client, parameters)
-        print(name, out)
+    fileset = {name: data for name, data in fileset.items() if name in ds_names}
+    if args.sequential:
+        # Process datasets individually
+        for name, data in fileset.items():
+            parameters["fileset"] = {name: data}
+            out = submit_job(client, parameters)
+            print(name, out)
+    else:
+        results = submit_datasets(
+            client, parameters, fileset, timeout=parameters.get("dataset_timeout")
+        )
+        failed = [name for name, out in results.items() if out.startswith("Failed")]
+        print(f"Processed {len(results) - len(failed)}/{len(results)} datasets")
+        if len(failed) > 0:
+            print("Failed datasets: ", failed)
 
     elapsed = round(time.time() - tick, 3)
     print(f"Finished everything in {elapsed} s.")
@@ -3,7 +3,7 @@ import tqdm
 import argparse
 import dask
 from dask.distributed import Client
-import pandas as pd
+import dask.dataframe as dd
 
 from delphes.postprocessor import load_dataframe
 from delphes.config.variables import variables_lookup
@@ -293,15 +293,20 @@ if __name__ == "__main__":
             if len(path) == 0:
                 continue
             df = load_dataframe(client, parameters, inputs=[path])
+            if not isinstance(df, dd.DataFrame):
+                continue
             dfs.append(df)
             # to_histograms(client, parameters, df=df)
 
-        df = pd.concat(dfs)
-        df.reset_index(inplace=True, drop=True)
-        run_mva(client, parameters, df)
+        if len(dfs) > 0:
+            df = dd.concat(dfs).compute()
+            df.reset_index(inplace=True, drop=True)
+            run_mva(client, parameters, df)
+        else:
+            print("No input dataframes loaded")
 
         # scores = {k: "test_adv_score" for k in parameters["mva_channels"]}
-        # categorize_by_score(df, scores)
+        # df = categorize_by_score(df, scores)
         # print(df[["channel", "category"]])
 
     if args.plot:
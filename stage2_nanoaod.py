@@ -11,6 +11,7 @@ from nanoaod.config.mva_bins import mva_bins
 from nanoaod.config.variables import variables_lookup
 from python.convert import to_histograms
 from python.plotter import plotter
+from python.yields import yield_table, group_yields, save_yield_table
 
 __all__ = ["dask"]
 
@@ -40,6 +41,13 @@ parser.add_argument(
     action="store_true",
     help="Produce plots",
 )
+parser.add_argument(
+    "--yields",
+    dest="yields",
+    default=False,
+    action="store_true",
+    help="Produce yield tables",
+)
 parser.add_argument(
     "-y", "--years", nargs="+", help="Years to process", default=["2018"]
 )
@@ -80,8 +88,9 @@ parameters = {
     "models_path": "/depot/cms/hmm/trained_models/",
     "dnn_models": [],
     # "dnn_models": ["dnn_allyears_128_64_32"],
-    # keep in mind - xgboost version for evaluation
-    # should be exactly the same as the one used for training!
+    # models exported to ONNX / XGBoost JSON (python/inference.py) are
+    # evaluated without TensorFlow and with any xgboost version; otherwise
+    # xgboost version for evaluation should be the same as in training!
     # 'bdt_models': ['bdt_nest10000_weightCorrAndShuffle_2Aug'],
     "bdt_models": [],
     "do_massscan": False,
@@ -200,3 +209,10 @@ if __name__ == "__main__":
 
     if args.plot:
         yields = plotter(client, parameters)
+
+    if args.yields:
+        yields = yield_table(client, parameters)
+        save_yield_table(yields, f"{parameters['plots_path']}/yields.csv")
+        save_yield_table(
+            group_yields(yields), f"{parameters['plots_path']}/yields_grouped.csv"
+        )
@@ -0,0 +1,34 @@
+import sys
+
+[sys.path.append(i) for i in [".", ".."]]
+import time
+from math import erf, sqrt
+
+import numpy as np
+
+from python.math_tools import effective_sigma
+from test_tools import almost_equal
+
+
+def gaussian_integral(edges, mean, sigma):
+    cdf = np.array([0.5 * (1 + erf((e - mean) / (sigma * sqrt(2)))) for e in edges])
+    return np.diff(cdf)
+
+
+if __name__ == "__main__":
+    tick = time.time()
+
+    # For a Gaussian, the narrowest interval containing 68.3% of the
+    # integral is [mean - sigma, mean + sigma] (up to the rounding of 0.683)
+    edges = np.linspace(110, 150, 4001)
+    values = 1000 * gaussian_integral(edges, 125.0, 2.0)
+    assert almost_equal(effective_sigma(values, edges), 2.0, precision=0.01)
+
+    # Independent of the position of the peak within the range
+    values = 1000 * gaussian_integral(edges, 118.3, 1.5)
+    assert almost_equal(effective_sigma(values, edges), 1.5, precision=0.01)
+
+    assert effective_sigma(np.zeros(10), np.linspace(0, 1, 11)) == 0
+
+    elapsed = round(time.time() - tick, 3)
+    print(f"Finished everything in {elapsed} s.")
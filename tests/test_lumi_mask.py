@@ -0,0 +1,34 @@
+import sys
+
+[sys.path.append(i) for i in [".", ".."]]
+import time
+import json
+
+import numpy as np
+from coffea.lumi_tools import LumiMask
+
+from nanoaod.event_filters import LumiMaskLookup
+
+
+if __name__ == "__main__":
+    tick = time.time()
+    rng = np.random.default_rng(1)
+
+    path = "data/lumimasks/Cert_314472-325175_13TeV_17SeptEarlyReReco2018ABC_PromptEraD_Collisions18_JSON.txt"
+    with open(path) as f:
+        golden = json.load(f)
+    good_runs = np.array([int(run) for run in golden.keys()])
+    max_lumi = max(hi for ranges in golden.values() for _, hi in ranges)
+
+    # runs in the golden JSON, and runs next to them that are not
+    nevents = 100000
+    runs = rng.choice(good_runs, nevents) + rng.choice([0, 0, 0, 1], nevents)
+    lumis = rng.integers(1, max_lumi + 10, nevents)
+
+    new_mask = LumiMaskLookup(path)(runs, lumis)
+    old_mask = LumiMask(path)(runs, lumis)
+    assert new_mask.sum() > 0
+    assert (new_mask == old_mask).all()
+
+    elapsed = round(time.time() - tick, 3)
+    print(f"Finished everything in {elapsed} s.")
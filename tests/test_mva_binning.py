@@ -0,0 +1,61 @@
+import sys
+
+[sys.path.append(i) for i in [".", ".."]]
+import time
+import itertools
+
+import numpy as np
+
+from python.mva_binning import (
+    bins_from_target_yields,
+    bins_max_significance,
+    weighted_quantiles,
+    asimov_significance2,
+)
+from test_tools import almost_equal
+
+
+def total_significance2(edges, sig_score, sig_weight, bkg_score, bkg_weight):
+    s, _ = np.histogram(sig_score, bins=edges, weights=sig_weight)
+    b, _ = np.histogram(bkg_score, bins=edges, weights=bkg_weight)
+    if (b < 1.0).any():
+        return -np.inf
+    return asimov_significance2(s, b).sum()
+
+
+if __name__ == "__main__":
+    tick = time.time()
+    rng = np.random.default_rng(1)
+
+    # Each bin reproduces its target yield, filled from the highest score
+    score = rng.uniform(0, 5, 10000)
+    weight = np.full(len(score), 0.1)
+    target_yields = [300.0, 200.0, 150.0, 100.0]
+    bins = bins_from_target_yields(score, weight, target_yields)
+    yields, _ = np.histogram(score, bins=bins, weights=weight)
+    assert len(bins) == 6
+    assert bins[0] == 0 and bins[-1] == 5.0
+    for y, target in zip(yields[1:], target_yields):
+        assert abs(y - target) < 1.0
+
+    # Dynamic programming gives the best combination of candidate boundaries
+    sig_score = rng.normal(3.5, 0.7, 2000)
+    sig_weight = np.full(len(sig_score), 0.01)
+    bkg_score = rng.exponential(1.0, 20000)
+    bkg_weight = np.full(len(bkg_score), 0.5)
+    args = (sig_score, sig_weight, bkg_score, bkg_weight)
+    bins = bins_max_significance(*args, nbins=3, ncandidates=20)
+
+    quantiles = np.linspace(0, 1, 21)[1:-1]
+    candidates = np.unique(
+        np.round(weighted_quantiles(sig_score, sig_weight, quantiles), 3)
+    )
+    best = -np.inf
+    for n in range(3):
+        for cut in itertools.combinations(candidates, n):
+            edges = [0] + list(cut) + [5.0]
+            best = max(best, total_significance2(edges, *args))
+    assert almost_equal(total_significance2(bins, *args), best)
+
+    elapsed = round(time.time() - tick, 3)
+    print(f"Finished everything in {elapsed} s.")
@@ -0,0 +1,42 @@
+import sys
+
+[sys.path.append(i) for i in [".", ".."]]
+import time
+
+import numpy as np
+import pandas as pd
+
+from python.mva_diagnostics import make_histogram, roc_curve, auc
+from test_tools import almost_equal
+
+
+if __name__ == "__main__":
+    tick = time.time()
+    rng = np.random.default_rng(1)
+    sig = pd.DataFrame({"score": rng.beta(5, 2, 5000), "lumi_wgt": 0.1})
+    bkg = pd.DataFrame({"score": rng.beta(2, 5, 20000), "lumi_wgt": 2.0})
+    bins = 100
+    sig_hist = make_histogram(sig, "score", bins=bins)
+    bkg_hist = make_histogram(bkg, "score", bins=bins)
+    fpr, tpr, thresholds = roc_curve(sig_hist, bkg_hist)
+
+    # Direct computation: weighted fractions of events above each threshold
+    for t, f, p in zip(thresholds[1:-1], fpr[1:-1], tpr[1:-1]):
+        tpr_exp = sig.lumi_wgt[sig.score >= t].sum() / sig.lumi_wgt.sum()
+        fpr_exp = bkg.lumi_wgt[bkg.score >= t].sum() / bkg.lumi_wgt.sum()
+        assert almost_equal(p, tpr_exp)
+        assert almost_equal(f, fpr_exp)
+    assert fpr[0] == 0 and tpr[0] == 0
+    assert almost_equal(fpr[-1], 1) and almost_equal(tpr[-1], 1)
+
+    # AUC from binned scores: probability that a signal event has a higher
+    # score than a background event, counting ties in the same bin as 1/2
+    edges = np.linspace(0, 1, bins + 1)
+    s, _ = np.histogram(sig.score, bins=edges)
+    b, _ = np.histogram(bkg.score, bins=edges)
+    s, b = s / s.sum(), b / b.sum()
+    auc_exp = (s * (np.cumsum(b) - b)).sum() + 0.5 * (s * b).sum()
+    assert almost_equal(auc(fpr, tpr), auc_exp)
+
+    elapsed = round(time.time() - tick, 3)
+    print(f"Finished everything in {elapsed} s.")
@@ -0,0 +1,37 @@
+import sys
+
+[sys.path.append(i) for i in [".", ".."]]
+import time
+from functools import reduce
+
+import numpy as np
+
+from python.categorizer import QuantileSketch
+from test_tools import almost_equal
+
+
+if __name__ == "__main__":
+    tick = time.time()
+    rng = np.random.default_rng(1)
+    values = rng.normal(0.5, 0.2, 200000)
+    quantiles = np.array([0.1, 0.25, 0.5, 0.75, 0.9])
+
+    # Sketches of separate partitions merged together
+    sketches = [QuantileSketch(part) for part in np.array_split(values, 20)]
+    sketch = reduce(lambda a, b: a.merge(b), sketches)
+    assert len(sketch.means) <= sketch.size
+
+    expected = np.quantile(values, quantiles)
+    for q, e in zip(sketch.quantile(quantiles), expected):
+        assert almost_equal(q, e, precision=0.005)
+
+    # Weighted sketch compared with repeated values
+    weights = rng.integers(1, 4, 20000)
+    values = rng.uniform(0, 1, 20000)
+    sketch = QuantileSketch(values, weights)
+    expected = np.quantile(np.repeat(values, weights), quantiles)
+    for q, e in zip(sketch.quantile(quantiles), expected):
+        assert almost_equal(q, e, precision=0.005)
+
+    elapsed = round(time.time() - tick, 3)
+    print(f"Finished everything in {elapsed} s.")
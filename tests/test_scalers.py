@@ -0,0 +1,45 @@
+import sys
+
+[sys.path.append(i) for i in [".", ".."]]
+import time
+
+import numpy as np
+import pandas as pd
+import dask.dataframe as dd
+
+from python.scalers import Moments, feature_moments
+from test_tools import almost_equal
+
+
+if __name__ == "__main__":
+    tick = time.time()
+    rng = np.random.default_rng(1)
+    features = ["a", "b"]
+    df = pd.DataFrame(
+        {"a": rng.normal(3.0, 2.0, 10000), "b": rng.exponential(5.0, 10000)}
+    )
+    mean = df[features].values.mean(axis=0)
+    std = df[features].values.std(axis=0)
+
+    # Moments of batches of different sizes, merged together
+    moments = Moments(len(features))
+    for batch in np.array_split(df[features].values, [10, 500, 501, 7000]):
+        moments = moments + Moments(len(features)).update(batch)
+    assert moments.count == len(df)
+    for m, s, m_exp, s_exp in zip(moments.mean, moments.std, mean, std):
+        assert almost_equal(m, m_exp)
+        assert almost_equal(s, s_exp)
+
+    # Same result for pandas, Dask and iterables of dataframes
+    for data in [
+        df,
+        dd.from_pandas(df, npartitions=7),
+        (df.iloc[i : i + 3000] for i in range(0, len(df), 3000)),
+    ]:
+        scalers = feature_moments(data, features).scalers()
+        for i in range(len(features)):
+            assert almost_equal(scalers[0][i], mean[i])
+            assert almost_equal(scalers[1][i], std[i])
+
+    elapsed = round(time.time() - tick, 3)
+    print(f"Finished everything in {elapsed} s.")